@@ -0,0 +1,438 @@
+import sys, io, os, json, argparse, pathlib, platform, time, subprocess, tempfile, tracemalloc, contextlib
+
+import process_data, instrument
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description = "Elasticity data analyser benchmarks.")
+    parser.add_argument("path", nargs = "?", default = None,
+        help = "File or directory containing raw data to benchmark against. Synthetic data is generated if left out.")
+
+    parser.add_argument("--separator", default = ';', help = "Raw data field separator.")
+    parser.add_argument("--header-lines", type = int, default = 40, help = "Number of header lines.")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Number of times to repeat each measurement.")
+
+    parser.add_argument("--files", type = int, default = 12, help = "Number of synthetic raw files to generate.")
+    parser.add_argument("--rows", type = int, default = 20000, help = "Number of samples on each synthetic raw file.")
+    parser.add_argument("--specimens", type = int, default = 4, help = "Number of synthetic experiments per probe.")
+    parser.add_argument("--seed", type = int, default = 0, help = "Seed for the synthetic data generator.")
+    parser.add_argument("--generate", metavar = "DIR", default = None, help = "Just write the synthetic raw files to DIR and quit.")
+
+    parser.add_argument("--suite", action = "store_true", help = "Time every stage of the analyser instead of just the parsers.")
+    parser.add_argument("--json", metavar = "FILE", default = None, help = "Write the suite's results to FILE as JSON (`-` for stdout).")
+    parser.add_argument("--compare", metavar = "FILE", default = None, help = "Compare the suite's results against those on FILE, failing on regressions.")
+    parser.add_argument("--tolerance", type = float, default = 1.25, help = "Slowdown (or memory growth) factor over `--compare` considered a regression.")
+
+    parser.add_argument("--memory", action = "store_true", help = "Measure how much memory parsed experiments take up on each layout instead of parsing throughput.")
+
+    parser.add_argument("--imports", action = "store_true", help = "Measure the import time of every mode instead of parsing throughput.")
+    parser.add_argument("--import-budget", type = float, default = None, help = "Fail if any mode spends more than this many milliseconds importing modules.")
+
+    return parser.parse_args()
+
+def legacyFindYoung(elongation: list[float], tension: list[float]) -> dict:
+    # The original scikit-learn fit on the first half of the samples. scikit-learn isn't
+    # a dependency anymore, so the fit is just left out if it isn't installed.
+    try:
+        from sklearn.linear_model import LinearRegression
+    except ImportError:
+        return None
+    import numpy as np
+
+    fitPoints = int(len(elongation) / 2)
+    elongationX = np.array(elongation[:fitPoints]).reshape((-1, 1))
+    tensionY = np.array(tension[:fitPoints])
+
+    model = LinearRegression(fit_intercept = False).fit(elongationX, tensionY)
+    return {"E": model.coef_[0], "score": model.score(elongationX, tensionY)}
+
+def legacyNote():
+    # Imports scikit-learn up front if it's there, so that importing it isn't measured
+    # along with the first legacy parse.
+    try:
+        import sklearn.linear_model
+    except ImportError:
+        print("scikit-learn isn't installed: the legacy parser won't fit Young's modulus", file = sys.stderr)
+
+def legacyParseRawData(file: pathlib.Path, separator: str, headerLines: int) -> dict:
+    # The original per-line parser, kept around as the baseline to compare against.
+    parsedData = {"data": {"tensionMPa": [], "elongationN": []}}
+    for i, line in enumerate(file.read_text(encoding = "utf-8", errors = "replace").splitlines()):
+        sLine = line.split(separator)
+
+        if i < headerLines:
+            process_data.parseHeaderLine(parsedData, sLine)
+
+        elif i == headerLines:
+            colNames = [process_data.fieldMap.get(process_data.removeQuotes(field), "extensionMM") for field in sLine]
+            for colName in colNames:
+                parsedData["data"][colName] = []
+
+        else:
+            for measure, value in zip(colNames, sLine):
+                parsedData["data"][measure].append(float(value.replace(',', '.')))
+            parsedData["data"]["tensionMPa"].append(parsedData["data"]["loadN"][-1] / 40)
+            parsedData["data"]["elongationN"].append(parsedData["data"]["extensionMM"][-1] / 60)
+
+    parsedData["maxTensionMPa"] = max(parsedData["data"]["tensionMPa"])
+    parsedData["maxElongationN"] = max(parsedData["data"]["elongationN"])
+    parsedData["ductility"] = (float(parsedData["finalLength"]["value"]) - 60) / 60
+
+    parsedData["youngModule"] = legacyFindYoung(parsedData["data"]["elongationN"], parsedData["data"]["tensionMPa"])
+
+    return parsedData
+
+# Header fields of the synthetic raw files in the order the machine writes them. Fields
+# holding a measurement come with their unit: everything else is free text.
+synthHeader = {
+    "Tipo de ensayo": None, "Nombre del m\u00e9todo": None, "Nombre": None, "ID operador": None, "Empresa": None,
+    "Nombre lab.": None, "Fecha ensayo": None, "Temperatura": "C", "Humedad": "%", "Nota 1": None, "Nota 2": None,
+    "Nota 3": None, "Geometr\u00eda": None, "Probeta": None, "Nombre probeta": None, "Anchura": "mm", "Espesor": "mm",
+    "Longitud": "mm", "Di\u00e1metro": None, "Di\u00e1metro int": None, "Di\u00e1metro ext": None, "Espesor pared": None,
+    "\u00c1rea": "mm^2", "Densidad lineal": None, "Peso de pat\u00f3n": None, "Separa. rodillos de carga": None,
+    "Separa. rodillos de soporte": None, "Separaci\u00f3n rodillos": None, "Tipo fijaci\u00f3n": None, "Observaciones": None,
+    "Anchura final": None, "Espesor final": None, "Longitud final": "mm", "Di\u00e1metro final": None,
+    "Di\u00e1metro interior final": None, "Di\u00e1metro exterior final": None, "Espesor de pared final": None,
+    "\u00c1rea final": None, "Densidad lineal final": None
+}
+
+def synthRaw(file: pathlib.Path, probe: int, specimen: int, rows: int, rng):
+    # Writes a raw file just like the machine does: a 40 line header, the column names and
+    # `;` separated samples with decimal commas, all of it Latin-1 encoded with CRLFs. The
+    # curve is linear up to the yield point, dips a bit and then hardens until it breaks.
+    import numpy as np
+
+    E, yieldStrain, breakStrain = rng.uniform(800, 3000), rng.uniform(0.02, 0.05), rng.uniform(0.2, 0.6)
+    yieldTension = E * yieldStrain
+
+    strain = np.linspace(0, breakStrain, rows)
+    tension = np.where(strain < yieldStrain, E * strain,
+        yieldTension * (0.95 + 0.25 * (strain - yieldStrain) / (breakStrain - yieldStrain)))
+    tension += rng.normal(0, 0.0005 * yieldTension, rows)
+
+    values = {
+        "Temperatura": rng.uniform(20, 25), "Humedad": rng.uniform(40, 60), "Anchura": 10, "Espesor": 4, "Longitud": 60,
+        "\u00c1rea": 40, "Longitud final": 60 * (1 + breakStrain * rng.uniform(0.8, 1))
+    }
+    header = [f'"{field}:";"{values[field]:.2f}";"{unit}"' if unit else f'"{field}:";"Prob{probe}"' for field, unit in synthHeader.items()]
+    header += ['"Single"', '"Tiempo sec";"Extensi\u00f3n mm";"Carga N"']
+
+    samples = io.StringIO()
+    np.savetxt(samples, np.column_stack([np.arange(rows) * 0.1, strain * 60, tension * 40]), fmt = "%.3f;%.4f;%.5f", newline = "\r\n")
+    file.write_bytes(("\r\n".join(header) + "\r\n" + samples.getvalue().replace('.', ',')).encode("latin-1"))
+
+def genRawFiles(path: str, files: int, rows: int, specimens: int = 4, seed: int = 0) -> list[pathlib.Path]:
+    import numpy as np
+
+    path = pathlib.Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+    rng = np.random.default_rng(seed)
+
+    generated = []
+    for i in range(files):
+        generated.append(path / f"Prob{i // specimens}-{i % specimens + 1}.raw")
+        synthRaw(generated[-1], i // specimens, i % specimens + 1, rows, rng)
+    return generated
+
+def rawFiles(path: str) -> list[pathlib.Path]:
+    path = pathlib.Path(path)
+    if path.is_dir():
+        return sorted(file for file in path.iterdir() if file.suffix == ".raw")
+    return [path]
+
+def timeParser(parser, files: list[pathlib.Path], separator: str, headerLines: int, repeat: int) -> tuple[float, int]:
+    best, nRows = float("inf"), 0
+    for _ in range(repeat):
+        start, nRows = time.perf_counter(), 0
+        for file in files:
+            nRows += len(parser(file, separator, headerLines)["data"]["tensionMPa"])
+        best = min(best, time.perf_counter() - start)
+    return best, nRows
+
+def benchParse(files: list[pathlib.Path], separator: str, headerLines: int, repeat: int):
+    legacyNote()
+    print(f"{'parser':<12}{'rows':>12}{'seconds':>12}{'rows/s':>16}")
+    for name, parser in [("legacy", legacyParseRawData), ("vectorised", process_data.parseRawData)]:
+        elapsed, nRows = timeParser(parser, files, separator, headerLines, repeat)
+        print(f"{name:<12}{nRows:>12}{elapsed:>12.3f}{nRows / elapsed:>16.0f}")
+
+# Ways parsed experiments have been laid out in memory: dictionaries of lists, then every
+# column (derived ones included) as float64 arrays and now compact experiments holding
+# just the raw columns, either as float64 or as float32.
+def arraysParseRawData(file: pathlib.Path, separator: str, headerLines: int) -> dict:
+    parsedExperiment = process_data.parseRawData(file, separator, headerLines)
+    return {**parsedExperiment, "data": {column: parsedExperiment.data[column].copy() for column in parsedExperiment.data}}
+
+memoryLayouts = {
+    "lists": legacyParseRawData,
+    "arrays": arraysParseRawData,
+    "compact": process_data.parseRawData,
+    "float32": lambda file, separator, headerLines: process_data.parseRawData(file, separator, headerLines, dtype = "float32")
+}
+
+def benchMemory(files: list[pathlib.Path], separator: str, headerLines: int):
+    # Memory still held once every file is parsed, i.e. what keeping them around costs.
+    legacyNote()
+    print(f"{'layout':<12}{'samples':>12}{'MiB':>10}{'bytes/Msample':>16}")
+    for name, parser in memoryLayouts.items():
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        parsed = [parser(file, separator, headerLines) for file in files]
+        held = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        nSamples = sum(len(experimentData["data"]["loadN"]) for experimentData in parsed)
+        print(f"{name:<12}{nSamples:>12}{held / 2**20:>10.1f}{held / nSamples * 1e6:>16.0f}")
+        del parsed
+
+# Command line arguments for each mode, relative to a directory holding processed data,
+# together with the heavy modules each of them is expected to pull in. Modes are run in
+# this order: the later ones rely on the output of the earlier ones. Bear in mind openpyxl
+# imports NumPy on its own whenever it's available.
+importModes = {
+    "summarised-json": (["x", "--summarised-json"], []),
+    "summarised-excel": (["x", "--summarised-excel"], ["numpy", "openpyxl"]),
+    "shapiro": (["x", "--shapiro"], ["numpy", "scipy", "openpyxl"]),
+    "excel": (["x", "--excel"], ["numpy", "openpyxl"]),
+    "merge-excels": (["x", "--merge-excels"], ["numpy", "openpyxl"]),
+    "plots": (["x", "--plots"], ["numpy", "matplotlib"]),
+    "pipeline": (["x", "--pipeline"], ["numpy", "scipy", "openpyxl", "matplotlib"])
+}
+
+heavyModules = ["numpy", "pandas", "matplotlib", "scipy", "openpyxl"]
+
+def importTime(argv: list[str], cwd: str) -> tuple[float, list[str]]:
+    # Runs the analyser with `-X importtime` and adds up the cumulative time of every top
+    # level import. Returns that (in milliseconds) along with the heavy modules it pulled in.
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(pathlib.Path(process_data.__file__).resolve()), *argv],
+        cwd = cwd, capture_output = True, text = True)
+
+    totalUs, heavy = 0, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+
+        if name.strip().split(".")[0] in heavyModules:
+            heavy.add(name.strip().split(".")[0])
+
+        # Nested imports are indented beyond the single space following the separator.
+        if not name[1:].startswith(" "):
+            totalUs += int(cumulative)
+
+    return totalUs / 1000, sorted(heavy)
+
+def benchImports(path: str, budget: float = None) -> int:
+    # Each mode is run on a scratch directory so that we don't clutter the current one.
+    with tempfile.TemporaryDirectory() as scratch:
+        for subdir in ["excels", "plots"]:
+            (pathlib.Path(scratch) / subdir).mkdir()
+
+        modes = {"ingest": ([str(pathlib.Path(path).resolve())], ["numpy"]), **importModes}
+
+        regressions = []
+        print(f"{'mode':<20}{'import ms':>12}  heavy modules")
+        for mode, (argv, expected) in modes.items():
+            elapsed, heavy = importTime(argv, scratch)
+            print(f"{mode:<20}{elapsed:>12.1f}  {', '.join(heavy) or '-'}")
+
+            unexpected = [module for module in heavy if module not in expected]
+            if unexpected:
+                regressions.append(f"{mode} imports {', '.join(unexpected)}")
+            if budget is not None and elapsed > budget:
+                regressions.append(f"{mode} spends {elapsed:.1f} ms importing modules")
+
+    for regression in regressions:
+        print(f"Startup regression: {regression}", file = sys.stderr)
+    return 1 if regressions else 0
+
+def measure(fn, repeat: int) -> dict:
+    # Best wall time out of `repeat` runs plus the peak of memory allocated during one more
+    # run under `tracemalloc` (NumPy reports its buffers to it too). Tracing slows things
+    # down, so timed runs go untraced. Whatever the stages print is swallowed.
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    # Peak RSS is the high-water mark of the whole run so far.
+    return {"seconds": best, "peakTracedBytes": peak, "maxRssBytes": instrument.maxRssBytes()}
+
+def suiteStages(path: pathlib.Path, files: list[pathlib.Path], separator: str, headerLines: int, scratch: pathlib.Path) -> dict:
+    # Every stage works on the data produced by the ones before it, so that is prepared
+    # once up front. Each entry maps a stage onto the callable timing it and the number
+    # of items (rows, experiments or probes) it goes through.
+    with contextlib.redirect_stderr(io.StringIO()):
+        parsedFiles = process_data.ingestDirectory(path, scratch / "prepared.store", separator, headerLines, useCache = False)
+        summary = process_data.summarise(parsedFiles)
+    jsonText = json.dumps(parsedFiles, default = process_data.jsonDefault)
+
+    experiments = [experimentData for probeData in parsedFiles.values() for experimentData in probeData.values()]
+    nRows = sum(len(experimentData["data"]["tensionMPa"]) for experimentData in experiments)
+    for subdir in ["excels", "plots"]:
+        (scratch / subdir).mkdir(exist_ok = True)
+
+    def ingest():
+        for file in files:
+            process_data.parseRawData(file, separator, headerLines)
+
+    def ingestStore():
+        process_data.ingestDirectory(path, scratch / "bench.store", separator, headerLines, useCache = False)
+
+    def ingestCached():
+        process_data.ingestDirectory(path, scratch / "bench.store", separator, headerLines)
+
+    def jsonDump():
+        (scratch / "processed_data.json").write_text(json.dumps(parsedFiles, indent = 2, default = process_data.jsonDefault))
+
+    def findYoung():
+        for experimentData in experiments:
+            process_data.findYoung(experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"])
+
+    def findYoungBatch():
+        for probeData in parsedFiles.values():
+            process_data.findYoungBatch(probeData)
+
+    def dumpExcel():
+        for probeName, probeData in parsedFiles.items():
+            process_data.dumpExcel(scratch / "excels" / f"{probeName}.xlsx", probeData)
+
+    def joinExcels():
+        process_data.joinExcels(scratch / "joinedProbes.xlsx", parsedFiles.items())
+
+    def summaries():
+        process_data.dumpSummaryJSON(scratch / "summarised_probes.json", process_data.summarise(parsedFiles))
+        process_data.dumpSummaryExcel(scratch / "ProbeSummary.xlsx", process_data.summarise(parsedFiles))
+
+    def plots():
+        for probeName, probeData in parsedFiles.items():
+            process_data.genProbePlots(scratch / "plots", probeName, probeData)
+
+    return {
+        "parseRawData": (ingest, nRows),
+        "ingestStore": (ingestStore, nRows),
+        "ingestCached": (ingestCached, nRows),
+        "jsonDump": (jsonDump, nRows),
+        "jsonLoad": (lambda: json.loads(jsonText), nRows),
+        "findYoung": (findYoung, len(experiments)),
+        "findYoungBatch": (findYoungBatch, len(experiments)),
+        "dumpExcel": (dumpExcel, nRows),
+        "joinExcels": (joinExcels, nRows),
+        "summaries": (summaries, len(experiments)),
+        "shapiro": (lambda: process_data.shapiroWilkTest(scratch / "ShapiroProbes.xlsx", summary), len(parsedFiles)),
+        "plots": (plots, len(experiments) + len(parsedFiles))
+    }
+
+def gitRevision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd = pathlib.Path(__file__).resolve().parent,
+            capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchSuite(path: str, separator: str, headerLines: int, repeat: int) -> dict:
+    import numpy as np
+
+    path = pathlib.Path(path)
+    files = process_data.listRawFiles(path)
+    results = {
+        "revision": gitRevision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "files": len(files),
+        "bytes": sum(file.stat().st_size for file in files),
+        "repeat": repeat,
+        "stages": {}
+    }
+
+    print(f"{'stage':<16}{'items':>10}{'seconds':>10}{'items/s':>14}{'peak MiB':>10}{'RSS MiB':>10}", file = sys.stderr)
+    with tempfile.TemporaryDirectory() as scratch:
+        for stage, (fn, nItems) in suiteStages(path, files, separator, headerLines, pathlib.Path(scratch)).items():
+            result = {"items": nItems, **measure(fn, repeat)}
+            result["itemsPerSecond"] = nItems / result["seconds"] if result["seconds"] else None
+            results["stages"][stage] = result
+            print(f"{stage:<16}{nItems:>10}{result['seconds']:>10.3f}{result['itemsPerSecond'] or 0:>14.0f}" +
+                f"{result['peakTracedBytes'] / 2**20:>10.1f}{(result['maxRssBytes'] or 0) / 2**20:>10.1f}", file = sys.stderr)
+
+    return results
+
+def compareSuite(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # Stages missing on either side are just ignored: they can't be compared.
+    if results["bytes"] != baseline.get("bytes"):
+        print("Warning: the baseline was measured on a different amount of raw data", file = sys.stderr)
+
+    regressions = []
+    for stage, result in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None:
+            continue
+        for metric in ["seconds", "peakTracedBytes"]:
+            if previous[metric] and result[metric] > tolerance * previous[metric]:
+                regressions.append(f"{stage} {metric} went from {previous[metric]:.4g} to {result[metric]:.4g}")
+    return regressions
+
+def main():
+    args = parseArgs()
+
+    if args.generate:
+        genRawFiles(args.generate, args.files, args.rows, args.specimens, args.seed)
+        return 0
+
+    with tempfile.TemporaryDirectory() as synthetic:
+        path = args.path
+        if path is None:
+            print(f"Generating {args.files} synthetic raw files with {args.rows} rows each...", file = sys.stderr)
+            genRawFiles(synthetic, args.files, args.rows, args.specimens, args.seed)
+            path = synthetic
+
+        if args.imports:
+            return benchImports(path, args.import_budget)
+
+        files = rawFiles(path)
+        if not files:
+            print(f"Couldn't find any raw files on {path}...", file = sys.stderr)
+            return -1
+
+        if args.memory:
+            benchMemory(files, args.separator, args.header_lines)
+            return 0
+
+        if not args.suite:
+            benchParse(files, args.separator, args.header_lines, args.repeat)
+            return 0
+
+        # Stages such as ingestion work on whole directories.
+        if not pathlib.Path(path).is_dir():
+            print(f"The suite needs a directory of raw files: {path} isn't one...", file = sys.stderr)
+            return -1
+
+        results = benchSuite(path, args.separator, args.header_lines, args.repeat)
+
+    if args.json == "-":
+        print(json.dumps(results, indent = 2))
+    elif args.json:
+        pathlib.Path(args.json).write_text(json.dumps(results, indent = 2))
+
+    if args.compare:
+        regressions = compareSuite(results, json.loads(pathlib.Path(args.compare).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file = sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import pathlib, hashlib
+
+import store
+
+# Incremental re-processing: experiments on the store remember the raw file they were
+# parsed from (see `StoreWriter.add()`). As long as that file and the parsing settings
+# are the same we can skip `parseRawData()` altogether and reuse whatever's stored.
+
+# Bump this whenever the output of `parseRawData()` changes so that stale entries are parsed again.
+PARSER_VERSION = 4
+
+class CacheStats:
+    def __init__(self):
+        self.hits, self.misses, self.evicted = 0, 0, 0
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.evicted} evicted"
+
+def fingerprint(file: pathlib.Path, separator: str, headerLines: int, previous: dict = None, dtype: str = "float64") -> dict:
+    # Hashing every file on each run adds up: if the file's stat is the same as when the
+    # `previous` fingerprint was taken we trust its hash instead of reading it all again.
+    # The stat only decides whether to hash: see `unchanged()` for what's compared.
+    stat = file.stat()
+    fp = {
+        "path": str(file.resolve()),
+        "size": stat.st_size,
+        "mtimeNs": stat.st_mtime_ns,
+        "sha256": None,
+        "separator": separator,
+        "headerLines": headerLines,
+        "dtype": dtype,
+        "parserVersion": PARSER_VERSION
+    }
+    if previous is not None and previous == {**fp, "sha256": previous.get("sha256")}:
+        return previous
+
+    fp["sha256"] = hashlib.sha256(file.read_bytes()).hexdigest()
+    return fp
+
+def unchanged(stored: dict, fp: dict) -> bool:
+    # Files are told apart by their contents (and the settings they're parsed with) rather
+    # than their modification time, so that touched but unchanged files aren't parsed again.
+    return stored is not None and {**stored, "mtimeNs": None} == {**fp, "mtimeNs": None}
+
+def lookup(storePath: str, keys: list[tuple[str, str]], fingerprints: list[dict]) -> list[dict]:
+    # Returns the stored experiment for every `(probeName, experimentName)` key whose
+    # source fingerprint is unchanged and `None` for the ones to be parsed again.
+    if not store.storeExists(storePath):
+        return [None] * len(keys)
+
+    sources, stored = store.loadSources(storePath), store.loadStore(storePath)
+
+    return [
+        stored[probeName][experimentName] if unchanged(sources.get(probeName, {}).get(experimentName), fp) else None
+            for (probeName, experimentName), fp in zip(keys, fingerprints)
+    ]
@@ -0,0 +1,129 @@
+import os, pathlib, sqlite3
+
+# SQLite index of every probe and experiment on the store: header metadata (as parsed
+# through `fieldMap`) plus the summary scalars of each experiment. It lets us pick the
+# experiments to work on with plain SQL before touching any sample data at all.
+
+CATALOG_FILE = "catalog.sqlite"
+
+# Header fields we index, keyed by their column name on the catalog. The header's own
+# `name` field is indexed as `sampleName` so as not to clash with the experiment's name.
+headerColumns = {
+    "experimentType": "experimentType",
+    "methodName": "methodName",
+    "sampleName": "name",
+    "operatorID": "operatorID",
+    "labName": "labName",
+    "experimentDate": "experimentDate",
+    "temperature": "temperature",
+    "humidity": "humidity",
+    "geometry": "geometry",
+    "probeName": "probeName",
+    "width": "width",
+    "thickness": "thickness",
+    "length": "length",
+    "area": "area",
+    "finalLength": "finalLength"
+}
+
+scalarColumns = ["maxTensionMPa", "maxElongationN", "ductility", "energyToBreak", "yieldTensionMPa",
+    "yieldElongationN", "elongationAtBreak", "tensionAtBreak"]
+
+columns = ["probe", "experiment", "specimen"] + list(headerColumns) + scalarColumns + ["youngModuleE", "youngModuleScore"]
+
+def specimenIndex(experimentName: str) -> str:
+    # Experiments are named after their probe and specimen, as in `Prob14-3.raw`.
+    try:
+        return experimentName.split('.')[0].split('-')[1]
+    except IndexError:
+        return None
+
+# Header fields holding measurements rather than free text.
+numericHeaders = {"temperature", "humidity", "width", "thickness", "length", "area", "finalLength"}
+
+def headerValue(field: str, raw):
+    # Header values are kept as the machine wrote them (i.e. with decimal commas): index
+    # measurements as numbers so that they can be compared as such.
+    if field not in numericHeaders:
+        return raw
+    try:
+        return float(raw.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return raw
+
+def experimentRow(probeName: str, experimentName: str, experimentData: dict) -> tuple:
+    row = [probeName, experimentName, specimenIndex(experimentName)]
+    row += [headerValue(field, experimentData.get(field, {}).get("value")) for field in headerColumns.values()]
+    row += [experimentData.get(scalar) for scalar in scalarColumns]
+    row += [experimentData.get("youngModule", {}).get("E"), experimentData.get("youngModule", {}).get("score")]
+    return tuple(row)
+
+def populate(conn: sqlite3.Connection, probes: dict):
+    # Takes `{probeName: {experimentName: experimentData}}`: sample columns (if any) are ignored.
+    conn.execute(f"CREATE TABLE experiments ({', '.join(columns)}, PRIMARY KEY (probe, experiment))")
+    conn.execute("CREATE VIEW probes AS SELECT probe, COUNT(*) AS nExperiments FROM experiments GROUP BY probe")
+    conn.executemany(f"INSERT INTO experiments VALUES ({', '.join('?' * len(columns))})",
+        [experimentRow(probeName, experimentName, experimentData)
+            for probeName, probeData in probes.items() for experimentName, experimentData in probeData.items()])
+    conn.commit()
+
+def build(storePath: str, probes: dict):
+    # The catalog is rebuilt from scratch and swapped in place so that readers never see a half-built one.
+    path = pathlib.Path(storePath) / CATALOG_FILE
+    scratch = path.with_name(path.name + ".tmp")
+    scratch.unlink(missing_ok = True)
+
+    conn = sqlite3.connect(scratch)
+    try:
+        populate(conn, probes)
+    finally:
+        conn.close()
+    os.replace(scratch, path)
+
+def inMemory(probes: dict) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    populate(conn, probes)
+    return conn
+
+class Selection:
+    # Filters to pick experiments with. Patterns follow SQLite's GLOB syntax (i.e. shell
+    # wildcards) and `where` is any SQL expression on the catalog's columns.
+    def __init__(self, probes: list[str] = None, experiments: list[str] = None, excludeSpecimens: list[str] = None, where: str = None):
+        self.probes, self.experiments = probes or [], experiments or []
+        self.excludeSpecimens, self.where = excludeSpecimens or [], where
+
+    def __bool__(self) -> bool:
+        return bool(self.probes or self.experiments or self.excludeSpecimens or self.where)
+
+    def sql(self) -> tuple[str, list]:
+        clauses, params = [], []
+        if self.probes:
+            clauses.append("(" + " OR ".join("probe GLOB ?" for _ in self.probes) + ")")
+            params += self.probes
+        if self.experiments:
+            clauses.append("(" + " OR ".join("experiment GLOB ?" for _ in self.experiments) + ")")
+            params += self.experiments
+        if self.excludeSpecimens:
+            clauses.append(f"(specimen IS NULL OR specimen NOT IN ({', '.join('?' * len(self.excludeSpecimens))}))")
+            params += self.excludeSpecimens
+        if self.where:
+            clauses.append(f"({self.where})")
+        return " AND ".join(clauses) or "1", params
+
+def query(conn: sqlite3.Connection, selection: Selection, fields: list[str] = None) -> list[tuple]:
+    clause, params = selection.sql()
+    return conn.execute(f"SELECT {', '.join(fields or columns)} FROM experiments WHERE {clause} ORDER BY rowid", params).fetchall()
+
+def validate(selection: Selection):
+    # Runs the selection against an empty catalog so that bad conditions (think typos on
+    # `where`) raise `sqlite3.Error` before any work is done.
+    query(inMemory({}), selection)
+
+def selectKeys(conn: sqlite3.Connection, selection: Selection) -> set[tuple[str, str]]:
+    return set(query(conn, selection, ["probe", "experiment"]))
+
+def connect(storePath: str) -> sqlite3.Connection:
+    path = pathlib.Path(storePath) / CATALOG_FILE
+    if not path.is_file():
+        raise FileNotFoundError(f"{path} doesn't exist: re-process the data to build it")
+    return sqlite3.connect(path)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import math, typing
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+# Shape-preserving downsampling of tension/elongation curves. Long tests yield way more
+# samples than any plot or reviewer can make use of, so we keep a subset of them that
+# still looks the same. Functions return the indices of the samples to keep so that
+# any other column can be decimated alongside the curve. Bear in mind this is only
+# ever meant for presenting data: maxima, Young's modulus and the like are computed
+# on full resolution data.
+#
+# The method table is consulted when parsing arguments, hence NumPy being imported lazily.
+
+def lttb(x: np.ndarray, y: np.ndarray, nOut: int) -> np.ndarray:
+    import numpy as np
+
+    # Largest-Triangle-Three-Buckets: the first and last samples are always kept and the
+    # rest are split into `nOut - 2` buckets. We keep the sample of each bucket forming
+    # the largest triangle with the previously kept one and the average of the next bucket.
+    n = len(x)
+    if nOut >= n or nOut < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, nOut - 1).astype(int)
+    edges = np.append(edges, n)
+
+    indices = np.empty(nOut, dtype = np.intp)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(nOut - 2):
+        start, end = edges[i], edges[i + 1]
+        nextX, nextY = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+
+        areas = np.abs((x[a] - nextX) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (nextY - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    return indices
+
+def minMax(x: np.ndarray, y: np.ndarray, nOut: int) -> np.ndarray:
+    import numpy as np
+
+    # Splits the curve into `nOut / 2` equally sized buckets and keeps the lowest and
+    # highest samples on each of them. Everything's done on whole arrays at once.
+    n = len(y)
+    if nOut >= n or nOut < 2:
+        return np.arange(n)
+
+    size = math.ceil(n / (nOut // 2))
+    nBuckets = math.ceil(n / size)
+    pad = nBuckets * size - n
+
+    offsets = np.arange(nBuckets) * size
+    highest = offsets + np.argmax(np.pad(y, (0, pad), constant_values = -np.inf).reshape(nBuckets, size), axis = 1)
+    lowest = offsets + np.argmin(np.pad(y, (0, pad), constant_values = np.inf).reshape(nBuckets, size), axis = 1)
+
+    return np.unique(np.concatenate([[0], lowest, highest]))
+
+methods = {
+    "lttb": lttb,
+    "minmax": minMax
+}
+
+def downsample(x, y, nOut: int, method: str = "lttb") -> np.ndarray:
+    import numpy as np
+
+    # Returns the sorted indices of the samples to keep. The peak tension and the failure
+    # point (i.e. the last sample) are always on them no matter what the method picks.
+    x, y = np.asarray(x), np.asarray(y)
+    if not nOut or nOut >= len(y):
+        return np.arange(len(y))
+
+    return np.union1d(methods[method](x, y, nOut), [np.argmax(y), len(y) - 1])
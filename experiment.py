@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import typing, collections.abc
+
+# Compact in-memory model of an experiment. Parsed experiments used to be nested
+# dictionaries with a `{"value", "unit"}` dictionary per header field and every sample
+# column (derived ones included) held side by side. Instead:
+#
+#   - Header fields live on a slotted class, with units kept apart.
+#   - Only the columns the machine writes are held, as contiguous NumPy arrays which can
+#     be stored as float32 if need be. Tension and elongation are derived off load and
+#     extension whenever they're asked for, so they never take up memory for long.
+#
+# Both `Experiment` and its `Columns` are read-only mappings laid out just like the old
+# dictionaries, so code reading experiments (and JSON exports) doesn't tell them apart.
+
+# Header fields the machine writes, in the order it writes them.
+HEADER_FIELDS = [
+    "experimentType", "methodName", "name", "operatorID", "enterprise", "labName", "experimentDate",
+    "temperature", "humidity", "noteA", "noteB", "noteC", "geometry", "probe", "probeName", "width",
+    "thickness", "length", "diameter", "innerDiameter", "exteriorDiameter", "wallThickness", "area",
+    "linearDensity", "railWeight", "loadRollSeparation", "supportRollSeparation", "rollSeparation",
+    "fasteningType", "observations", "finalWidth", "finalThickness", "finalLength", "finalDiameter",
+    "finalInnerDiameter", "finalExteriorDiameter", "finalWallThickness", "finalArea", "finalLinearDensity"
+]
+
+# Scalars computed off the samples when parsing.
+SCALAR_FIELDS = ["ductility", "maxTensionMPa", "maxElongationN", "youngModule", "energyToBreak",
+    "yieldTensionMPa", "yieldElongationN", "elongationAtBreak", "tensionAtBreak"]
+
+# Derived columns along with the column they're derived from and what it's divided by:
+# stress is load over the cross-section (in mm^2) and strain is extension over the
+# gauge length (in mm).
+DERIVED_COLUMNS = {
+    "tensionMPa": ("loadN", "area"),
+    "elongationN": ("extensionMM", "length")
+}
+
+# Specimen geometry used when neither the header nor a profile tells us otherwise.
+DEFAULT_GEOMETRY = {"area": 40.0, "length": 60.0}
+
+Value = typing.Union[float, str, None]
+
+# Scalars we know nothing about (think experiments with no samples at all) are left unset
+# rather than `None`, which is a valid value for some of them: they just aren't there.
+# It's pickled by reference so that experiments parsed on worker processes keep it.
+class Unset:
+    def __repr__(self) -> str:
+        return "UNSET"
+
+    def __reduce__(self):
+        return "UNSET"
+
+UNSET = Unset()
+
+class Header:
+    # Header fields are plain attributes (`None` if missing) rather than a dictionary.
+    __slots__ = (*HEADER_FIELDS, "units", "extra")
+
+    def __init__(self, **fields: Value):
+        for key in HEADER_FIELDS:
+            setattr(self, key, fields.pop(key, None))
+        if fields:
+            raise TypeError(f"unknown header fields: {', '.join(fields)}")
+
+        # Units of the fields that have one and header lines we couldn't make sense of, as
+        # `{"value", "unit"}` dictionaries.
+        self.units, self.extra = {}, {}
+
+    @classmethod
+    def fromFields(cls, fields: collections.abc.Mapping) -> Header:
+        # Takes the `{"value", "unit"}` dictionaries of the old layout.
+        header = cls()
+        for key, field in fields.items():
+            if key in HEADER_FIELDS:
+                setattr(header, key, field["value"])
+                if field.get("unit", "none") != "none":
+                    header.units[key] = field["unit"]
+            elif isinstance(field, collections.abc.Mapping) and "value" in field:
+                header.extra[key] = dict(field)
+        return header
+
+    def fields(self):
+        # Yields `(key, {"value", "unit"})` for every field that's present.
+        for key in HEADER_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                yield key, {"value": value, "unit": self.units.get(key, "none")}
+        yield from self.extra.items()
+
+    def get(self, key: str) -> dict:
+        if key in self.extra:
+            return self.extra[key]
+        value = getattr(self, key, None) if key in HEADER_FIELDS else None
+        return None if value is None else {"value": value, "unit": self.units.get(key, "none")}
+
+def measurement(fields: collections.abc.Mapping, key: str) -> float | None:
+    # A header measurement as a positive number: placeholders such as `x0` don't count.
+    field = fields.get(key)
+    try:
+        value = float(str(field["value"]).replace(',', '.'))
+    except (TypeError, KeyError, ValueError):
+        return None
+    return value if value > 0 else None
+
+def resolveGeometry(fields: collections.abc.Mapping, profile: dict = None) -> dict:
+    # Cross-section (in mm^2) and gauge length (in mm) of a specimen. A `profile` (see
+    # `geometryProfile()`) overrides the header, which in turn overrides the defaults.
+    # Either may give the cross-section as an `area` or as a `width` and a `thickness`.
+    geometry = {}
+    for source in [{key: {"value": value} for key, value in (profile or {}).items()}, fields]:
+        area = measurement(source, "area")
+        if area is None and measurement(source, "width") and measurement(source, "thickness"):
+            area = measurement(source, "width") * measurement(source, "thickness")
+        if area is not None:
+            geometry.setdefault("area", area)
+        if measurement(source, "length") is not None:
+            geometry.setdefault("length", measurement(source, "length"))
+    return {**DEFAULT_GEOMETRY, **geometry}
+
+GEOMETRY_KEYS = ["area", "width", "thickness", "length"]
+
+def loadProfiles(path: str) -> dict:
+    # Geometry profiles are kept on a JSON file mapping probe names (shell wildcards
+    # allowed) to the dimensions that override their headers, as in
+    # `{"Prob1*": {"width": 10, "thickness": 2}, "Prob3": {"area": 20, "length": 50}}`.
+    import json, pathlib
+
+    profiles = json.loads(pathlib.Path(path).read_text())
+    for pattern, profile in profiles.items():
+        for key, value in profile.items():
+            if key not in GEOMETRY_KEYS:
+                raise ValueError(f"unknown dimension {key} on the geometry profile of {pattern}: expected one of {', '.join(GEOMETRY_KEYS)}")
+            if not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"{key} on the geometry profile of {pattern} must be a positive number of millimetres")
+    return profiles
+
+def geometryProfile(profiles: dict, probeName: str) -> dict:
+    # Profiles are matched in the order they're given in: the first one matching wins.
+    import fnmatch
+
+    for pattern, profile in (profiles or {}).items():
+        if fnmatch.fnmatchcase(probeName, pattern):
+            return profile
+    return None
+
+class Columns(collections.abc.Mapping):
+    # The raw columns of an experiment, with derived ones computed on access as a whole.
+    # Older versions stored derived columns too: they're ignored whenever the column
+    # they're derived from is there, so that the geometry can be changed.
+    def __init__(self, raw: dict, geometry: dict = None):
+        self.raw = raw
+        self.geometry = {**DEFAULT_GEOMETRY, **(geometry or {})}
+
+    def stored(self) -> list[str]:
+        return list(self.raw)
+
+    def load(self, column: str):
+        return self.raw[column]
+
+    def __getitem__(self, column: str):
+        if column in DERIVED_COLUMNS and DERIVED_COLUMNS[column][0] in self.stored():
+            source, divisor = DERIVED_COLUMNS[column]
+            return self.load(source) / self.geometry[divisor]
+        if column in self.stored():
+            return self.load(column)
+        raise KeyError(column)
+
+    def __iter__(self):
+        stored = self.stored()
+        yield from [column for column, (source, _) in DERIVED_COLUMNS.items() if column not in stored and source in stored]
+        yield from stored
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+class Experiment(collections.abc.Mapping):
+    __slots__ = ("header", "data", *SCALAR_FIELDS)
+
+    def __init__(self, header: Header, data: Columns, **scalars):
+        self.header, self.data = header, data
+        for key in SCALAR_FIELDS:
+            setattr(self, key, scalars.pop(key, UNSET))
+        if scalars:
+            raise TypeError(f"unknown scalars: {', '.join(scalars)}")
+
+    # Mapping interface: keys are laid out as in the old dictionaries, plus the specimen
+    # geometry samples were derived with under `dimensions`.
+    def __getitem__(self, key: str):
+        if key == "data":
+            return self.data
+        if key == "dimensions":
+            return self.data.geometry
+        if key in SCALAR_FIELDS and getattr(self, key) is not UNSET:
+            return getattr(self, key)
+        field = self.header.get(key)
+        if field is None:
+            raise KeyError(key)
+        return field
+
+    def __setitem__(self, key: str, value):
+        # Only scalars and the geometry can be updated, as when metrics are recomputed.
+        if key == "dimensions":
+            self.data.geometry = {**DEFAULT_GEOMETRY, **value}
+        elif key in SCALAR_FIELDS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield "data"
+        yield "dimensions"
+        yield from (key for key, _ in self.header.fields())
+        yield from (key for key in SCALAR_FIELDS if getattr(self, key) is not UNSET)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+def fromDict(experimentData: collections.abc.Mapping, dtype: str = "float64") -> Experiment:
+    # Builds an experiment off the old layout. Derived columns are dropped whenever the
+    # columns they're derived from are there. Experiments that don't say which geometry
+    # they were derived with used the default one.
+    import numpy as np
+
+    data = experimentData["data"]
+    raw = {column: np.ascontiguousarray(data[column], dtype = dtype) for column in data
+        if column not in DERIVED_COLUMNS or DERIVED_COLUMNS[column][0] not in data}
+
+    return Experiment(
+        header = Header.fromFields({key: value for key, value in experimentData.items() if key not in ["data", "dimensions"] and key not in SCALAR_FIELDS}),
+        data = Columns(raw, experimentData.get("dimensions")),
+        **{key: experimentData[key] for key in SCALAR_FIELDS if key in experimentData}
+    )
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import typing
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+# Per-group statistics computed in a single pass over every group at once. Groups (say,
+# the maximum tensions of each probe's experiments) are laid out as the rows of a NaN
+# padded matrix so that descriptive statistics can be computed on whole arrays.
+#
+# The Shapiro-Wilk test is the one exception: `scipy.stats.shapiro()` only learnt about
+# `axis` after SciPy 1.10 so we still call it once per group, albeit on rows of the
+# very same matrix.
+
+def padGroups(groups: list) -> tuple[np.ndarray, np.ndarray]:
+    import numpy as np
+
+    counts = np.array([len(group) for group in groups], dtype = int)
+    values = np.full((len(groups), counts.max(initial = 0)), np.nan)
+    for i, group in enumerate(groups):
+        values[i, :counts[i]] = group
+
+    return values, counts
+
+def shapiroBatch(values: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Groups with less than 3 samples get NaNs: the test makes no sense on them.
+    import numpy as np
+    from scipy import stats
+
+    statistic, pvalue = np.full(len(counts), np.nan), np.full(len(counts), np.nan)
+    for i in np.flatnonzero(counts >= 3):
+        statistic[i], pvalue[i] = stats.shapiro(values[i, :counts[i]])
+
+    return statistic, pvalue
+
+def describe(values: np.ndarray, counts: np.ndarray, confidence: float = 0.95) -> dict:
+    # Mean, sample standard deviation, coefficient of variation and the Student's t
+    # confidence interval of the mean for every group. NaN padding is ignored.
+    import numpy as np
+    from scipy import stats
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        mean = np.nansum(values, axis = 1) / counts
+        std = np.where(counts > 1, np.sqrt(np.nansum((values - mean[:, None]) ** 2, axis = 1) / np.maximum(counts - 1, 1)), np.nan)
+        halfWidth = stats.t.ppf((1 + confidence) / 2, counts - 1) * std / np.sqrt(counts)
+
+        return {
+            "n": counts,
+            "mean": mean,
+            "std": std,
+            "cv": std / mean,
+            "ciLow": mean - halfWidth,
+            "ciHigh": mean + halfWidth
+        }
+
+def groupStatistics(groups: list, confidence: float = 0.95) -> dict:
+    # Returns a dictionary of per-group arrays with the Shapiro-Wilk results and the
+    # descriptive statistics of each group.
+    values, counts = padGroups(groups)
+    statistic, pvalue = shapiroBatch(values, counts)
+    return {"statistic": statistic, "pvalue": pvalue, **describe(values, counts, confidence)}
+
+# Columns of the tidy tables we export, in order.
+statColumns = ["statistic", "pvalue", "n", "mean", "std", "cv", "ciLow", "ciHigh"]
+statHeaders = ["Statistic (W)", "p-value", "n", "Mean", "Std. Dev.", "CV", "CI Low", "CI High"]
+
+def tidyRows(labels: list[tuple], results: dict) -> list[list]:
+    # One row per group: its labels followed by its statistics. NaNs are exported as
+    # empty cells.
+    rows = []
+    for i, label in enumerate(labels):
+        row = list(label)
+        for column in statColumns:
+            value = results[column][i].item()
+            row.append(None if value != value else value)
+        rows.append(row)
+    return rows
@@ -0,0 +1,239 @@
+import os, sys, json, time, fnmatch, pathlib
+
+# Structured instrumentation for the analyser. Stages open spans with `span()`, which
+# record their wall and CPU time, the process' peak RSS once they're done and whatever
+# arguments (rows, bytes, cache hits...) they're given. Unless tracing is enabled spans
+# are no-ops, so instrumented code pays next to nothing for them.
+#
+# Spans can be profiled too: stages matching one of the `profile` patterns are run under
+# cProfile (and dumped as `.prof` files), whilst the ones matching a `memory` pattern are
+# run under tracemalloc, recording their peak and top allocation sites on the span.
+#
+# Worker processes record spans of their own: tasks are submitted through `submit()` so
+# that they're shipped back along with the task's result and merged on `result()`.
+
+def maxRssBytes() -> int:
+    # Peak resident set size of the process so far, or `None` where we can't tell. The
+    # `resource` module is Unix only: elsewhere we make do with psutil, if it's around.
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+
+    # `ru_maxrss` is given in bytes on macOS and in kibibytes everywhere else.
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == "darwin" else maxRss * 1024
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        pass
+
+    def set(self, **args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    def __init__(self, tracer, name: str, category: str, args: dict):
+        self.tracer, self.name, self.category, self.args = tracer, name, category, args
+        self.profiler, self.tracingMemory = None, False
+        # Highest traced memory (as an absolute figure) seen whilst nested spans had the
+        # peak reset on us.
+        self.peakFloor = 0
+
+    def __enter__(self):
+        if self.tracer.matches(self.tracer.profile, self.name) and not self.tracer.profiling:
+            import cProfile
+            self.profiler, self.tracer.profiling = cProfile.Profile(), True
+            self.profiler.enable()
+
+        if self.tracer.matches(self.tracer.memory, self.name):
+            import tracemalloc
+            # Nested spans share the outer span's tracing: we just reset its peak, after
+            # saving it on the outer span so that it can take it into account later on.
+            self.tracingMemory = not tracemalloc.is_tracing()
+            if self.tracingMemory:
+                tracemalloc.start()
+            elif self.tracer.memorySpans:
+                outer = self.tracer.memorySpans[-1]
+                outer.peakFloor = max(outer.peakFloor, tracemalloc.get_traced_memory()[1])
+            self.tracer.memorySpans.append(self)
+            self.tracedBaseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        self.start, self.cpuStart = time.perf_counter_ns(), time.process_time_ns()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        end, cpuEnd = time.perf_counter_ns(), time.process_time_ns()
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.tracer.profiling = False
+            self.args["profile"] = self.tracer.dumpProfile(self.profiler, self.name)
+
+        if self.tracer.matches(self.tracer.memory, self.name):
+            import tracemalloc
+            # The peak is reported relative to what was already allocated on entry: memory
+            # held by outer spans isn't this one's doing.
+            peak = max(tracemalloc.get_traced_memory()[1], self.peakFloor)
+            self.args["tracedPeakBytes"] = peak - self.tracedBaseline
+            self.args["topAllocations"] = [f"{stat.traceback} {stat.size}" for stat in tracemalloc.take_snapshot().statistics("lineno")[:10]]
+            self.tracer.memorySpans.pop()
+            if self.tracer.memorySpans:
+                outer = self.tracer.memorySpans[-1]
+                outer.peakFloor = max(outer.peakFloor, peak)
+            if self.tracingMemory:
+                tracemalloc.stop()
+
+        if excType is not None:
+            self.args["error"] = excType.__name__
+
+        self.tracer.events.append({
+            "name": self.name,
+            "category": self.category,
+            "pid": os.getpid(),
+            "startNs": self.start,
+            "wallNs": end - self.start,
+            "cpuNs": cpuEnd - self.cpuStart,
+            "maxRssBytes": maxRssBytes(),
+            "args": self.args
+        })
+
+    def set(self, **args):
+        self.args.update(args)
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.profile, self.memory, self.profileDir = [], [], "profiles"
+        self.profiling = False
+        self.nProfiles = 0
+        # Spans currently tracing memory, innermost last.
+        self.memorySpans = []
+
+    def configure(self, profile: list[str] = None, memory: list[str] = None, profileDir: str = "profiles"):
+        self.enabled = True
+        self.profile, self.memory, self.profileDir = profile or [], memory or [], profileDir
+
+    def config(self) -> dict:
+        return {"profile": self.profile, "memory": self.memory, "profileDir": self.profileDir}
+
+    def matches(self, patterns: list[str], name: str) -> bool:
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+    def span(self, name: str, category: str = "stage", **args):
+        return Span(self, name, category, args) if self.enabled else NULL_SPAN
+
+    def mark(self, name: str, category: str = "stage", **args):
+        # An instantaneous event, such as the parse cache's statistics.
+        if self.enabled:
+            self.events.append({"name": name, "category": category, "instant": True, "pid": os.getpid(), "startNs": time.perf_counter_ns(),
+                "wallNs": 0, "cpuNs": 0, "maxRssBytes": maxRssBytes(), "args": args})
+
+    def dumpProfile(self, profiler, name: str) -> str:
+        path = pathlib.Path(self.profileDir)
+        path.mkdir(parents = True, exist_ok = True)
+        self.nProfiles += 1
+        path = path / f"{name}-{os.getpid()}-{self.nProfiles}.prof"
+        profiler.dump_stats(path)
+        return str(path)
+
+tracer = Tracer()
+
+def span(name: str, category: str = "stage", **args):
+    return tracer.span(name, category, **args)
+
+def mark(name: str, category: str = "stage", **args):
+    tracer.mark(name, category, **args)
+
+def traced(fn):
+    # Decorator recording a span named after the function on every call.
+    import functools
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with tracer.span(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+class Remote:
+    # Runs a task on a worker process with the parent's tracing settings, handing the
+    # spans it records back along with its result.
+    def __init__(self, fn, config: dict):
+        self.fn, self.config = fn, config
+
+    def __call__(self, *args):
+        tracer.configure(**self.config)
+        tracer.events = []
+        result = self.fn(*args)
+        return result, tracer.events
+
+def submit(pool, fn, *args):
+    if not tracer.enabled:
+        return pool.submit(fn, *args)
+    return pool.submit(Remote(fn, tracer.config()), *args)
+
+def result(future):
+    if not tracer.enabled:
+        return future.result()
+    value, events = future.result()
+    tracer.events.extend(events)
+    return value
+
+# Trace writers. Times are given relative to the first event recorded.
+formats = ["chrome", "json", "csv"]
+csvColumns = ["name", "category", "pid", "startS", "wallS", "cpuS", "maxRssBytes", "args"]
+
+def rows(events: list[dict]) -> list[dict]:
+    epoch = min((event["startNs"] for event in events), default = 0)
+    return [{
+        "name": event["name"],
+        "category": event["category"],
+        "pid": event["pid"],
+        "startS": (event["startNs"] - epoch) / 1e9,
+        "wallS": event["wallNs"] / 1e9,
+        "cpuS": event["cpuNs"] / 1e9,
+        "maxRssBytes": event["maxRssBytes"],
+        "args": event["args"]
+    } for event in sorted(events, key = lambda event: event["startNs"])]
+
+def chromeTrace(events: list[dict]) -> dict:
+    # See the Trace Event Format: complete (`X`) events for spans and instant (`i`) ones for marks.
+    epoch = min((event["startNs"] for event in events), default = 0)
+    return {"traceEvents": [{
+        "name": event["name"],
+        "cat": event["category"],
+        "ph": "i" if event.get("instant") else "X",
+        "ts": (event["startNs"] - epoch) / 1e3,
+        **({"s": "p"} if event.get("instant") else {"dur": event["wallNs"] / 1e3}),
+        "pid": event["pid"],
+        "tid": event["pid"],
+        "args": {**event["args"], "cpuMs": event["cpuNs"] / 1e6, "maxRssBytes": event["maxRssBytes"]}
+    } for event in events], "displayTimeUnit": "ms"}
+
+def dump(path: str, fmt: str = "chrome"):
+    if fmt == "chrome":
+        pathlib.Path(path).write_text(json.dumps(chromeTrace(tracer.events)))
+    elif fmt == "json":
+        pathlib.Path(path).write_text(json.dumps(rows(tracer.events), indent = 2))
+    elif fmt == "csv":
+        import csv
+        with open(path, "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = csvColumns)
+            writer.writeheader()
+            for row in rows(tracer.events):
+                writer.writerow({**row, "args": json.dumps(row["args"])})
+    else:
+        raise ValueError(f"unknown trace format {fmt}")
+
+    print(f"Trace with {len(tracer.events)} events written to {path}", file = sys.stderr)
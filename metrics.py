@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import young
+
+# Per-experiment metrics accumulated whilst samples are ingested. Samples are fed in
+# blocks through `update()` and only running aggregates are kept around, so by the time
+# the last block is in every metric is ready without going over the samples again:
+#
+#   - Maximum tension and elongation.
+#   - The through-origin fit of Young's modulus on the fit window. Rather than raw sums
+#     (which lose the score to cancellation on well-fitted curves) each block is fitted
+#     on its own and merged with the running fit, as Chan et al. do for the variance:
+#     the residuals of two fits with slopes E1 and E2 add up to those of the merged fit
+#     less `(E1 - E2)^2 * sxx1 * sxx2 / (sxx1 + sxx2)`, and the mean and sum of squared
+#     deviations of tension (for the total sum of squares) merge just the same way.
+#   - Break point: the last sample carrying at least `1 - fractureDrop` of the maximum
+#     tension so far, i.e. the one right before the load falls away for good. Samples
+#     recorded past it (the broken specimen's tail) don't count towards anything below.
+#   - Energy to break: the area under the tension-elongation curve (trapezoidal rule) up
+#     to the break point. As elongation is a strain and tension is given in MPa it comes
+#     out in MJ/m^3.
+#   - Yield point: following ISO 527-1, the first maximum of the tension, i.e. the first
+#     time elongation increases without tension doing so. Machine noise would trigger it
+#     right away, so a maximum (of at least `yieldMinTension` MPa) is only taken to be
+#     the yield point once tension has dropped at least `yieldDrop` below it and it has
+#     stayed unbeaten for `yieldSpan` of elongation, with the specimen still carrying at
+#     least `1 - fractureDrop` of it by then: noise is beaten by the rising curve long
+#     before that, and the load falling away as the specimen breaks isn't carried. Curves
+#     without a yield point (think brittle specimens or ones that keep on hardening until
+#     they break) just don't get one.
+
+# Number of samples to feed the accumulator with at a time: this keeps temporaries small.
+CHUNK_ROWS = 1 << 16
+
+YIELD_DROP = 0.01
+YIELD_MIN_TENSION = 1.0
+YIELD_SPAN = 0.005
+FRACTURE_DROP = 0.5
+
+class ExperimentAccumulator:
+    def __init__(self, nSamples: int, fitWindow: str = young.DEFAULT_WINDOW, yieldDrop: float = YIELD_DROP, yieldMinTension: float = YIELD_MIN_TENSION,
+            yieldSpan: float = YIELD_SPAN, fractureDrop: float = FRACTURE_DROP):
+        # The number of samples is needed beforehand to know where fraction-based windows end.
+        self.fitWindow = fitWindow
+        self.window = young.parseWindow(fitWindow)
+        self.fitPoints = int(nSamples * self.window[1]) if self.window[0] == "fraction" else None
+
+        self.yieldDrop, self.yieldMinTension, self.yieldSpan, self.fractureDrop = yieldDrop, yieldMinTension, yieldSpan, fractureDrop
+
+        self.n = 0
+        self.maxTension, self.maxElongation = float("-inf"), float("-inf")
+        self.nFit, self.sxx, self.sxy, self.ssRes, self.meanY, self.m2Y = 0, 0.0, 0.0, 0.0, 0.0, 0.0
+        self.energy = 0.0
+        self.last = None
+
+        # The break point so far as `(elongation, tension, energy up to it)`.
+        self.breakPoint = None
+
+        # Highest (tension, elongation) seen whilst we're still looking for the yield point,
+        # and whether tension has dropped `yieldDrop` off it since.
+        self.candidate = None
+        self.dropped = False
+        self.yieldPoint = None
+
+    def update(self, elongation, tension):
+        import numpy as np
+
+        elongation, tension = np.asarray(elongation, dtype = float), np.asarray(tension, dtype = float)
+        if not len(tension):
+            return
+
+        self.maxTension = max(self.maxTension, float(tension.max()))
+        self.maxElongation = max(self.maxElongation, float(elongation.max()))
+
+        if self.fitPoints is not None:
+            inWindow = slice(0, max(0, min(len(tension), self.fitPoints - self.n)))
+        else:
+            inWindow = (elongation >= self.window[1]) & (elongation <= self.window[2])
+        x, y = elongation[inWindow], tension[inWindow]
+        if len(x):
+            self.updateFit(x, y)
+
+        # Energy up to every sample: trapezoids within the block plus the one bridging it
+        # with the previous block.
+        bridge = float(elongation[0] - self.last[0]) * float(tension[0] + self.last[1]) / 2 if self.last is not None else 0.0
+        energy = self.energy + bridge + np.concatenate([[0.0], np.cumsum(np.diff(elongation) * (tension[1:] + tension[:-1]) / 2)])
+        self.energy = float(energy[-1])
+
+        runningMax = np.maximum.accumulate(tension)
+        if self.n:
+            runningMax = np.maximum(runningMax, self.runningMax)
+        self.runningMax = float(runningMax[-1])
+
+        carrying = np.flatnonzero(tension >= runningMax * (1 - self.fractureDrop))
+        if len(carrying):
+            last = carrying[-1]
+            self.breakPoint = (float(elongation[last]), float(tension[last]), float(energy[last]))
+
+        if self.yieldPoint is None:
+            self.updateYield(elongation, tension)
+
+        self.last = (float(elongation[-1]), float(tension[-1]))
+        self.n += len(tension)
+
+    def updateFit(self, x, y):
+        import numpy as np
+
+        n, sxx, sxy = len(x), float(x @ x), float(x @ y)
+        E = sxy / sxx if sxx > 0 else 0.0
+        ssRes = float(np.sum((y - E * x) ** 2))
+        meanY = float(y.mean())
+        m2Y = float(np.sum((y - meanY) ** 2))
+
+        total = self.sxx + sxx
+        if total > 0:
+            previousE = self.sxy / self.sxx if self.sxx > 0 else 0.0
+            ssRes += (previousE - E) ** 2 * self.sxx * sxx / total
+
+        delta = meanY - self.meanY
+        self.meanY += delta * n / (self.nFit + n)
+        self.m2Y += m2Y + delta * delta * self.nFit * n / (self.nFit + n)
+
+        self.nFit += n
+        self.sxx, self.sxy = total, self.sxy + sxy
+        self.ssRes += ssRes
+
+    def updateYield(self, elongation, tension):
+        import numpy as np
+
+        # The candidate behind every sample is the highest one up to it. Candidates carried
+        # over from the previous block are indexed as -1.
+        previous = self.candidate[0] if self.candidate is not None else float("-inf")
+        indices = np.arange(len(tension))
+        runningMax = np.maximum(np.maximum.accumulate(tension), previous)
+        isNew = tension > np.concatenate([[previous], runningMax[:-1]])
+        candidate = np.maximum.accumulate(np.where(isNew, indices, -1))
+        candidateTension = np.where(candidate >= 0, tension[candidate], previous)
+        candidateElongation = np.where(candidate >= 0, elongation[candidate], self.candidate[1] if self.candidate is not None else np.nan)
+
+        # Whether tension dropped `yieldDrop` off the candidate at some point after it.
+        drops = np.maximum.accumulate(np.where(tension < runningMax * (1 - self.yieldDrop), indices, -1))
+        dropped = (drops > candidate) | ((candidate < 0) & self.dropped)
+
+        confirmed = np.flatnonzero(dropped & (candidateTension >= self.yieldMinTension) & (elongation >= candidateElongation + self.yieldSpan) &
+            (tension >= candidateTension * (1 - self.fractureDrop)))
+        if len(confirmed):
+            self.yieldPoint = (float(candidateTension[confirmed[0]]), float(candidateElongation[confirmed[0]]))
+            return
+
+        if np.isfinite(runningMax[-1]):
+            self.candidate = (float(candidateTension[-1]), float(candidateElongation[-1]))
+        self.dropped = bool(dropped[-1])
+
+    def youngModule(self) -> dict:
+        # Same results as `young.fitBatch()`, only computed off the merged block fits.
+        if not self.nFit:
+            return {"E": float("nan"), "score": float("nan"), "window": self.fitWindow}
+
+        E = self.sxy / self.sxx if self.sxx > 0 else 0.0
+        ssRes, ssTot = self.ssRes, self.m2Y
+        score = 1 - ssRes / ssTot if ssTot > 0 else (1.0 if ssRes == 0 else 0.0)
+
+        return {"E": E, "score": score, "window": self.fitWindow}
+
+    def result(self) -> dict:
+        if not self.n:
+            return {"youngModule": self.youngModule()}
+
+        # Curves that never carry any load break wherever they end.
+        breakPoint = self.breakPoint or (*self.last, self.energy)
+        return {
+            "maxTensionMPa": self.maxTension,
+            "maxElongationN": self.maxElongation,
+            "youngModule": self.youngModule(),
+            "energyToBreak": breakPoint[2],
+            "yieldTensionMPa": self.yieldPoint[0] if self.yieldPoint else None,
+            "yieldElongationN": self.yieldPoint[1] if self.yieldPoint else None,
+            "elongationAtBreak": breakPoint[0],
+            "tensionAtBreak": breakPoint[1]
+        }
+
+def accumulate(elongation, tension, fitWindow: str = young.DEFAULT_WINDOW) -> dict:
+    # Feeds a whole experiment to an accumulator one block at a time.
+    acc = ExperimentAccumulator(len(tension), fitWindow)
+    for start in range(0, len(tension), CHUNK_ROWS):
+        acc.update(elongation[start:start + CHUNK_ROWS], tension[start:start + CHUNK_ROWS])
+    return acc.result()
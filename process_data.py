@@ -1,17 +1,30 @@
+# Annotations mentioning NumPy and friends are never evaluated: see below.
+from __future__ import annotations
+
 # Ignore deprecation warnings emitted by openpyxl.
     # This bit needs to appear BEFORE importing openpyxl...
 import warnings
 warnings.simplefilter("ignore", DeprecationWarning)
 
-import sys, argparse, pathlib, json, io, openpyxl
+import sys, os, time, typing, signal, argparse, pathlib, json, io, hashlib, itertools, sqlite3, collections, collections.abc, concurrent.futures
+
+# Heavy dependencies (NumPy, pandas, matplotlib, SciPy and openpyxl) take seconds to
+# import, so they're only imported within the functions that need them. That way
+# lightweight modes such as `--summarised-json` start up right away.
+import store, catalog, cache, downsample, young, groupstats, metrics, instrument, watch, experiment
 
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+# Only type checkers get to see NumPy from up here.
+if typing.TYPE_CHECKING:
+    import numpy as np
 
-from sklearn.linear_model import LinearRegression
+def pyplot():
+    import matplotlib
 
-from scipy import stats
+    # Plots are only ever saved to disk: we don't need an interactive backend at all.
+    matplotlib.use("Agg")
+
+    import matplotlib.pyplot as plt
+    return plt
 
 fieldMap = {
     "Tipo de ensayo": "experimentType",
@@ -64,13 +77,35 @@ fieldMap = {
     "Tenacidad gf/tex": "tenacity"
 }
 
+def fitWindow(spec: str) -> str:
+    try:
+        young.parseWindow(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+def pointCount(spec: str) -> int:
+    # Curves are never downsampled to fewer than their first, last and one sample between.
+    points = int(spec)
+    if points < 0 or points in (1, 2):
+        raise argparse.ArgumentTypeError(f"can't downsample to {points} points: give 0 to keep every sample or at least 3")
+    return points
+
+def geometryProfiles(path: str) -> dict:
+    try:
+        return experiment.loadProfiles(path)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(f"couldn't load geometry profiles off {path}: {e}")
+
 def parseArgs():
     parser = argparse.ArgumentParser(description = "Elasticity data analyser.")
     parser.add_argument("path", help = "File or directory containing raw data.")
 
     parser.add_argument("--output", default = 'processed_data.json', help = "JSON file to output processed data to.")
+    parser.add_argument("--export-json", action = "store_true", help = "Export processed data to `--output` as JSON too.")
 
-    parser.add_argument("--input", default = 'processed_data.json', help = "JSON file to read processed data from.")
+    parser.add_argument("--store", default = 'processed_data.store', help = "Directory holding the binary store of processed data.")
+    parser.add_argument("--input", default = None, help = "JSON file to read processed data from instead of the binary store.")
     parser.add_argument("--summary", default = 'summarised_probes.json', help = "JSON file to read summarised data from.")
 
     parser.add_argument("--separator", default = ';', help = "Raw data field separator.")
@@ -79,9 +114,25 @@ def parseArgs():
 
     parser.add_argument("--header-lines", type = int, default = 40, help = "Number of header lines.")
 
+    parser.add_argument("--fit-window", type = fitWindow, default = young.DEFAULT_WINDOW,
+        help = "Samples to fit Young's modulus on: either `fraction:F` (the first F of the samples) or `strain:LO:HI` (elongations within [LO, HI]).")
+
+    parser.add_argument("--geometry", type = geometryProfiles, default = {},
+        help = "JSON file with the specimen geometry (`area` or `width` and `thickness`, plus `length`, in mm) of the probes matching each pattern, overriding their headers.")
+    parser.add_argument("--recompute", action = "store_true",
+        help = "Derive tension and elongation again off the stored samples with the current `--geometry` and `--fit-window` and recompute every metric, without parsing any raw file.")
+
+    parser.add_argument("--float32", dest = "dtype", action = "store_const", const = "float32", default = "float64",
+        help = "Keep samples as single precision floats, halving the memory and disk they take. Metrics are still computed on double precision.")
+
+    parser.add_argument("--no-cache", action = "store_true", help = "Parse every raw file again even if it's unchanged since the last run.")
+
+    parser.add_argument("--jobs", type = int, default = 1, help = "Number of worker processes to parse raw files and render plots with (0 uses every core).")
+
     parser.add_argument("--excel", action = "store_true", help = "Dump summarised Excel files per probe.")
 
-    parser.add_argument("--merge-excels", action = "store_true", help = "Merge existing Excels on `--excel-dir` into a big one.")
+    parser.add_argument("--merge-excels", action = "store_true", help = "Dump the sheets of every per-probe Excel into a big one.")
+    parser.add_argument("--merged-excel", default = "joinedProbes.xlsx", help = "Excel file to dump merged sheets to.")
 
     parser.add_argument("--summarised-excel", action = "store_true", help = "Generate a one-sheet summary Excel.")
     parser.add_argument("--output-excel-summary", default = "ProbeSummary.xlsx", help = "Excel file to dump probe data summary to.")
@@ -92,12 +143,41 @@ def parseArgs():
     parser.add_argument("--shapiro", action = "store_true", help = "Pass the Shapiro-Wilk test on the summarised data.")
     parser.add_argument("--shapiro-output", default = "ShapiroProbes.xlsx", help = "Excel file to dump the Shapiro-Wilk test results to.")
 
+    parser.add_argument("--confidence", type = float, default = 0.95, help = "Confidence level of the intervals reported along with the Shapiro-Wilk test.")
+
     parser.add_argument("--shore", action = "store_true", help = "Pass the Shapiro-Wilk test on the Shore hardness data.")
 
     parser.add_argument("--plots", action = "store_true", help = "Generate plots.")
     parser.add_argument("--plots-custom", action = "store_true", help = "Generate custom plots.")
     parser.add_argument("--plot-dir", default = "./plots", help = "Directory to store plots to.")
 
+    parser.add_argument("--plot-points", type = pointCount, default = 0, help = "Downsample plotted curves to about this many points (0 plots every sample).")
+    parser.add_argument("--plot-downsample", choices = downsample.methods.keys(), default = "lttb", help = "Downsampling method for plots.")
+    parser.add_argument("--excel-points", type = pointCount, default = 0, help = "Downsample per-probe Excel sheets to about this many rows (0 dumps every sample).")
+    parser.add_argument("--excel-downsample", choices = downsample.methods.keys(), default = "lttb", help = "Downsampling method for per-probe Excels.")
+
+    parser.add_argument("--probe", action = "append", default = [], help = "Only work on probes matching this pattern (shell wildcards allowed). Can be given several times.")
+    parser.add_argument("--experiment", action = "append", default = [], help = "Only work on experiments matching this pattern (shell wildcards allowed). Can be given several times.")
+    parser.add_argument("--exclude-specimen", action = "append", default = None,
+        help = "Leave out experiments of this specimen index, as in `Prob14-9.raw`. Can be given several times. The Shapiro-Wilk test leaves out 9 and 10 by default.")
+    parser.add_argument("--where", default = None, help = "Only work on experiments matching this SQL condition on the catalog, as in `operatorID = 'ana' AND temperature > 20`.")
+    parser.add_argument("--query", action = "store_true", help = "List the selected experiments along with their catalog entries.")
+
+    parser.add_argument("--watch", action = "store_true", help = "Keep on watching `path` for new or modified raw files, updating the store and every requested output " +
+        "(all of them if none is) as they show up.")
+    parser.add_argument("--watch-interval", type = float, default = 1.0, help = "Seconds between each look at the watched directory.")
+    parser.add_argument("--watch-settle", type = float, default = 2.0, help = "Seconds a raw file must go unchanged for before it's considered complete.")
+
+    parser.add_argument("--trace", default = None, help = "Record how long each stage and file takes (plus rows, bytes, peak RSS and cache hits) to this file.")
+    parser.add_argument("--trace-format", choices = instrument.formats, default = "chrome",
+        help = "Format of the `--trace` file: Chrome's trace event format (open it on chrome://tracing or Perfetto), a JSON list of events or CSV.")
+    parser.add_argument("--profile", action = "append", default = [], help = "Run stages matching this pattern (e.g. `parseRawData` or `dump*`) under cProfile. Can be given several times.")
+    parser.add_argument("--profile-memory", action = "append", default = [], help = "Record the peak memory and top allocations of stages matching this pattern with tracemalloc. Can be given several times.")
+    parser.add_argument("--profile-dir", default = "./profiles", help = "Directory to dump cProfile statistics to.")
+
+    parser.add_argument("--pipeline", action = "store_true", help = "Generate every requested output (all of them if none is) in a single pass over the data. " +
+        "Raw data is ingested first if `path` is a directory.")
+
     return parser.parse_args()
 
 def removeQuotes(raw: str) -> str:
@@ -121,234 +201,480 @@ def parseHeaderLine(parsedData: dict[str, dict[str]], line: list[str]):
         print(f"expected 1, 2 or 3 fields and got {len(line)}: {line}. Quitting...")
         sys.exit(-1)
 
-def dumpExcel(path: str, parsedData):
+def headerCells(ws, names: list[str]) -> list:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    # Mimic the bold column headers pandas used to give us.
+    cells = []
+    for name in names:
+        cell = WriteOnlyCell(ws, value = name)
+        cell.font = Font(bold = True)
+        cells.append(cell)
+    return cells
+
+# Excel won't have sheet names longer than 31 characters, with any of these characters
+# or differing from another sheet's name in case alone.
+SHEET_TITLE_LENGTH = 31
+SHEET_TITLE_FORBIDDEN = str.maketrans({c: "_" for c in "[]:*?/\\"})
+
+def sheetTitle(name: str, taken: set[str]) -> str:
+    # Returns a valid sheet name for `name` no other sheet has taken yet, adding it to `taken`.
+    # Colliding names are told apart with a `~N` suffix.
+    base = name.translate(SHEET_TITLE_FORBIDDEN)[:SHEET_TITLE_LENGTH]
+    title, n = base, 1
+    while title.lower() in taken:
+        n += 1
+        title = base[:SHEET_TITLE_LENGTH - len(f"~{n}")] + f"~{n}"
+    taken.add(title.lower())
+    return title
+
+def writeExperimentSheet(wb, title: str, processedData: dict, points: int = 0, method: str = "lttb") -> int:
+    # Appends a sheet with the experiment's header block and data columns to a write-only
+    # workbook. Bear in mind write-only worksheets can only be appended to, so rows must be
+    # emitted in order. Returns the number of data rows written.
+    import numpy as np
+
     chosenColNames = ["tensionMPa", "elongationN", "extensionMM", "loadN"]
 
-    excelBuff = io.BytesIO()
-    excelWriter = pd.ExcelWriter(excelBuff)
-
-    with pd.ExcelWriter(excelBuff) as writer:
-        for fName, processedData in parsedData:
-            df = pd.DataFrame(
-                [[processedData["data"][colName][i] for colName in chosenColNames] for i in range(len(processedData["data"][chosenColNames[0]]))],
-                columns = ["Tensión [MPa]", "Elongación [N]", "Extensión [mm]", "Carga [N]"]
-            )
-            df.to_excel(writer, sheet_name = fName, index = False, startrow = 8, startcol = 0)
-
-    excelBuff.seek(0, io.SEEK_SET)
-
-    wb = openpyxl.load_workbook(excelBuff)
-    for fName, processedData in parsedData:
-        ws = wb[fName]
-
-        ws["A1"] = "Máximos:"
-        ws["A2"] = "Tensión Máxima [MPa]:"
-        ws["B2"] = processedData["data"]["maxTensionMPa"]
-        ws["A3"] = "Elongación Máxima [N]:"
-        ws["B3"] = processedData["data"]["maxElongationN"]
-        ws["A4"] = "Ductilidad [%]:"
-        ws["B4"] = processedData["data"]["ductility"]
-        ws["A5"] = "Longitud final [mm]:"
-        ws["B5"] = processedData["finalLength"]["value"]
-        ws["A6"] = "E / Score (1 is best):"
-        ws["B6"] = processedData["youngModule"]["E"]
-        ws["C6"] = processedData["youngModule"]["score"]
-
-    excelBuff.seek(0, io.SEEK_SET)
-    pathlib.Path(path).write_bytes(openpyxl.writer.excel.save_virtual_workbook(wb))
-
-def parseRawData(file: pathlib.Path, separator: str, headerLines: int) -> dict:
+    ws = wb.create_sheet(title = title)
+
+    ws.append(["Máximos:"])
+    ws.append(["Tensión Máxima [MPa]:", processedData["maxTensionMPa"]])
+    ws.append(["Elongación Máxima [N]:", processedData["maxElongationN"]])
+    ws.append(["Ductilidad [%]:", processedData["ductility"]])
+    ws.append(["Longitud final [mm]:", processedData["finalLength"]["value"]])
+    ws.append(["E / Score (1 is best):", processedData["youngModule"]["E"], processedData["youngModule"]["score"]])
+    ws.append([])
+    ws.append([])
+
+    # Maxima above come from the full resolution data: only the dumped rows are decimated.
+    keep = downsample.downsample(processedData["data"]["elongationN"], processedData["data"]["tensionMPa"], points, method)
+
+    ws.append(headerCells(ws, ["Tensión [MPa]", "Elongación [N]", "Extensión [mm]", "Carga [N]"]))
+    for row in zip(*[np.asarray(processedData["data"][colName])[keep].tolist() for colName in chosenColNames]):
+        ws.append(row)
+
+    return len(keep)
+
+def dumpExcel(path: str, parsedData, points: int = 0, method: str = "lttb"):
+    import openpyxl
+
+    # Sheets are streamed straight to disk in a single pass.
+    wb = openpyxl.Workbook(write_only = True)
+    with instrument.span("dumpExcel", path = str(path)) as span:
+        nRows, taken = 0, set()
+        for fName, processedData in parsedData.items():
+            nRows += writeExperimentSheet(wb, sheetTitle(fName, taken), processedData, points, method)
+
+        wb.save(path)
+        span.set(sheets = len(parsedData), rows = nRows)
+
+def splitRawText(text: str, headerLines: int) -> tuple[list[str], str, str]:
+    # Only the header block and the column names are split into lines: the data
+    # section is handed over as a single string so that NumPy can chew on it.
+    sections = text.split("\n", headerLines + 1)
+    if len(sections) < headerLines + 2:
+        sections += [""] * (headerLines + 2 - len(sections))
+    return [line.rstrip("\r") for line in sections[:headerLines]], sections[headerLines].rstrip("\r"), sections[-1]
+
+def loadColumns(rawData: str, separator: str, nCols: int) -> np.ndarray:
+    import numpy as np
+
+    # The machine writes decimals with a comma: swapping them for a dot in one go
+    # is way faster than doing so on a per-cell basis. Fields past the named columns
+    # (think trailing separators) are left out, just like the per-line parser did.
+    if not rawData.strip():
+        return np.empty((nCols, 0))
+    return np.loadtxt(io.StringIO(rawData.replace(',', '.')), delimiter = separator, ndmin = 2, dtype = float, usecols = range(nCols)).T
+
+def computeMetrics(experimentData, geometry: dict, fitWindow: str = young.DEFAULT_WINDOW):
+    # Derives tension and elongation off the stored load and extension with the given
+    # specimen geometry, then computes every metric off them. Maxima, Young's modulus and
+    # the rest of them are accumulated in a single pass, always on double precision samples.
+    experimentData["dimensions"] = geometry
+    experimentData["data"].geometry = geometry
+
+    experimentData["ductility"] = (float(experimentData["finalLength"]["value"]) - geometry["length"]) / geometry["length"]
+    for key, value in metrics.accumulate(experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"], fitWindow).items():
+        experimentData[key] = value
+
+def parseRawData(file: pathlib.Path, separator: str, headerLines: int, fitWindow: str = young.DEFAULT_WINDOW, dtype: str = "float64",
+        profile: dict = None) -> experiment.Experiment:
     print(f"Parsing file: {file.name}...", file = sys.stderr)
-    parsedData = {"data": {"tensionMPa": [], "elongationN": []}}
-    for i, line in enumerate(file.read_text(encoding = "utf-8", errors = "replace").splitlines()):
-        # print(f"Parsing line: {line}", file = sys.stderr)
-
-        sLine = line.split(separator)
-
-        if i < headerLines:
-            parseHeaderLine(parsedData, sLine)
-
-        elif i == headerLines:
-            colNames = [fieldMap.get(removeQuotes(field), "extensionMM") for field in sLine]
-            for colName in colNames:
-                parsedData["data"][colName] = []
-
-        else:
-            for measure, value in zip(colNames, sLine):
-                parsedData["data"][measure].append(float(value.replace(',', '.')))
-            parsedData["data"]["tensionMPa"].append(parsedData["data"]["loadN"][-1] / 40)
-            parsedData["data"]["elongationN"].append(parsedData["data"]["extensionMM"][-1] / 60)
-
-    parsedData["maxTensionMPa"] = max(parsedData["data"]["tensionMPa"])
-    parsedData["maxElongationN"] = max(parsedData["data"]["elongationN"])
-    parsedData["ductility"] = (float(parsedData["finalLength"]["value"]) - 60) / 60
-
-    parsedData["youngModule"] = findYoung(parsedData["data"]["elongationN"], parsedData["data"]["tensionMPa"])
-
-    return parsedData
-
-def findYoung(elongation: list[float], tension: list[float]) -> dict:
-    # Number of samples to take into account for the linear regression
-    fitPoints = int(len(elongation) / 2)
-
-    # Converting the vectors into NumPy arrays...
-    elongationX = np.array(elongation[:fitPoints]).reshape((-1, 1))
-    tensionY = np.array(tension[:fitPoints])
-
-    # Time to fit the data!
-
-    # Returning the results. Bear in mind the `fit_intercept` kwarg implies
-    # we take the intercept with the Y axis to be 0.
-    model = LinearRegression(fit_intercept = False).fit(elongationX, tensionY)
-    return {"E": model.coef_[0], "score": model.score(elongationX, tensionY)}
-
-def joinExcels(path: str):
-    joinedExcels = pd.ExcelWriter("joinedProbes.xlsx")
-
-    for file in pathlib.Path(path).iterdir():
-        print(f"Mergeing Excel file {file.absolute()}...")
-        currExcel = pd.ExcelFile(file.absolute())
-
-        # Returns all the sheets as dataframes!
-        dfs = pd.read_excel(currExcel, None)
+    parsedData = {"data": {}}
+
+    with instrument.span("parseRawData", "file", file = file.name) as span:
+        text = file.read_text(encoding = "utf-8", errors = "replace")
+        headerBlock, colLine, rawData = splitRawText(text, headerLines)
+
+        for line in headerBlock:
+            parseHeaderLine(parsedData, line.split(separator))
+
+        colNames = [fieldMap.get(removeQuotes(field), "extensionMM") for field in colLine.split(separator)]
+        for colName, column in zip(colNames, loadColumns(rawData, separator, len(colNames))):
+            parsedData["data"][colName] = column
+
+        # Each column gets its own contiguous array, so the matrix NumPy parsed them into is
+        # freed right away. Tension and elongation are derived on access (see experiment.py)
+        # with the geometry given on the header unless the probe's `profile` says otherwise.
+        parsedExperiment = experiment.fromDict(parsedData)
+        computeMetrics(parsedExperiment, experiment.resolveGeometry(parsedData, profile), fitWindow)
+
+        span.set(rows = len(parsedExperiment.data["loadN"]), bytes = file.stat().st_size)
+
+    # Samples are only downcast (if at all) once everything's been computed.
+    if dtype != "float64":
+        parsedExperiment.data.raw = {column: samples.astype(dtype) for column, samples in parsedExperiment.data.raw.items()}
+
+    return parsedExperiment
+
+def isRawFile(file: pathlib.Path) -> bool:
+    parts = file.name.split('.')
+    return len(parts) > 1 and parts[1] == "raw"
+
+def listRawFiles(path: str) -> list[pathlib.Path]:
+    # Files are sorted so that the output doesn't depend on the order the filesystem
+    # hands them over in nor on how many workers we parse them with.
+    return sorted(file for file in pathlib.Path(path).iterdir() if isRawFile(file))
+
+def resolveJobs(jobs: int) -> int:
+    return os.cpu_count() if jobs == 0 else jobs
+
+def boundedMap(pool: concurrent.futures.Executor, fn, argsList, inFlight: int):
+    # Like `pool.map()`, but only `inFlight` tasks are submitted at a time so that results
+    # (and their arguments) don't pile up in memory when they're consumed slower than
+    # they're produced. Results are yielded in the same order the arguments are given in.
+    pending, remaining = collections.deque(), iter(argsList)
+    for args in itertools.islice(remaining, inFlight):
+        pending.append(instrument.submit(pool, fn, *args))
+
+    while pending:
+        result = instrument.result(pending.popleft())
+        for args in itertools.islice(remaining, 1):
+            pending.append(instrument.submit(pool, fn, *args))
+        yield result
+
+def parseRawFiles(files: list[pathlib.Path], separator: str, headerLines: int, jobs: int = 1, fitWindow: str = young.DEFAULT_WINDOW, pool: concurrent.futures.Executor = None,
+        dtype: str = "float64", profiles: dict = None):
+    # Yields the parsed files in the very same order they're given in. Long-running callers
+    # can hand over a `pool` of `jobs` workers of their own instead of spawning a new one.
+    jobs = resolveJobs(jobs)
+    argsList = [(file, separator, headerLines, fitWindow, dtype, experiment.geometryProfile(profiles, experimentKey(file)[0])) for file in files]
+
+    if pool is not None and len(files) > 1:
+        yield from boundedMap(pool, parseRawData, argsList, 2 * jobs)
+        return
 
-        for sheetName, sheetDf in dfs.items():
-            sheetDf.to_excel(joinedExcels, sheet_name = sheetName, startrow = 0, startcol = 0)
+    if jobs <= 1 or len(files) <= 1:
+        for args in argsList:
+            yield parseRawData(*args)
+        return
 
-    joinedExcels.close()
+    # Each file is independent of the rest: fan them out to a pool of workers keeping a
+    # couple of files per worker in flight.
+    jobs = min(jobs, len(files))
+    with concurrent.futures.ProcessPoolExecutor(max_workers = jobs) as pool:
+        yield from boundedMap(pool, parseRawData, argsList, 2 * jobs)
+
+def experimentKey(file: pathlib.Path) -> tuple[str, str]:
+    return file.name.split('-')[0], file.name
+
+def ingestProbes(path: str, storePath: str, separator: str, headerLines: int, jobs: int = 1, useCache: bool = True, fitWindow: str = young.DEFAULT_WINDOW,
+        files: list[pathlib.Path] = None, pool: concurrent.futures.Executor = None, dtype: str = "float64", profiles: dict = None,
+        frozen: set[pathlib.Path] = frozenset()):
+    # Yields `(probeName, probeData)` one probe at a time whilst keeping the store up to date.
+    # The store ends up holding the given `files` (every raw file on `path` by default).
+    # Whatever's on the store for the `frozen` ones (think files being written again) is
+    # kept as it is without even looking at them, as long as the cache is on: those that
+    # aren't stored are left out.
+    files = listRawFiles(path) if files is None else sorted(files)
+    sources = store.loadSources(storePath) if store.storeExists(storePath) else {}
+    files = [file for file in files if file not in frozen or experimentKey(file)[1] in sources.get(experimentKey(file)[0], {})]
+
+    probes = {}
+    for file in files:
+        probes.setdefault(experimentKey(file)[0], []).append(file)
+    files = [file for probeFiles in probes.values() for file in probeFiles]
+
+    keys = [experimentKey(file) for file in files]
+    with instrument.span("fingerprint", files = len(files)) as span:
+        fingerprints = [sources[probeName][experimentName] if file in frozen else
+            cache.fingerprint(file, separator, headerLines, sources.get(probeName, {}).get(experimentName) if useCache else None, dtype) for file, (probeName, experimentName) in zip(files, keys)]
+        span.set(bytes = sum(fp["size"] for fp in fingerprints))
+
+    # Only new or modified files go through the parser: everything else comes off the store.
+    with instrument.span("cacheLookup", files = len(files)):
+        cached = cache.lookup(storePath, keys, fingerprints) if useCache else [None] * len(files)
+    parsed = parseRawFiles([file for file, hit in zip(files, cached) if hit is None], separator, headerLines, jobs, fitWindow, pool, dtype, profiles)
+
+    stats = cache.CacheStats()
+    with store.StoreWriter(storePath) as writer:
+        entries = iter(zip(keys, fingerprints, cached))
+        for probeName, probeFiles in probes.items():
+            probeData, hits = {}, {}
+            for (_, experimentName), fp, hit in itertools.islice(entries, len(probeFiles)):
+                if hit is None:
+                    probeData[experimentName] = next(parsed)
+                    with instrument.span("storeAdd", "file", file = experimentName, rows = len(probeData[experimentName]["data"]["tensionMPa"])):
+                        writer.add(probeName, experimentName, probeData[experimentName], source = fp)
+                    stats.misses += 1
+                else:
+                    probeData[experimentName] = hit
+                    hits[experimentName] = fp
+                    stats.hits += 1
+
+            # Cached experiments computed with a different fit window or geometry get their
+            # metrics recomputed off the stored columns instead of parsing them all over again.
+            stale = recomputeProbe(probeName, {experimentName: probeData[experimentName] for experimentName in hits}, fitWindow, profiles)
+
+            # The source is updated too, as touched files keep their contents but not their stat.
+            for experimentName, fp in hits.items():
+                writer.keep(probeName, experimentName, {key: value for key, value in probeData[experimentName].items() if key != "data"} if experimentName in stale else None, fp)
+
+            yield probeName, probeData
+
+    stats.evicted = writer.nEvicted
+    print(f"Parse cache: {stats}", file = sys.stderr)
+    instrument.mark("parseCache", hits = stats.hits, misses = stats.misses, evicted = stats.evicted)
+
+def recomputeProbe(probeName: str, probeData: dict, fitWindow: str = young.DEFAULT_WINDOW, profiles: dict = None, force: bool = False) -> list[str]:
+    # Recomputes the metrics of the experiments whose fit window or geometry isn't the
+    # requested one (every one of them if `force`d), returning their names.
+    profile = experiment.geometryProfile(profiles, probeName)
+    stale = {}
+    for experimentName, experimentData in probeData.items():
+        geometry = experiment.resolveGeometry(experimentData, profile)
+        if force or experimentData.get("dimensions") != geometry or experimentData["youngModule"].get("window") != fitWindow:
+            stale[experimentName] = geometry
+
+    with instrument.span("recompute", "probe", probe = probeName, experiments = len(stale)):
+        for experimentName, geometry in stale.items():
+            computeMetrics(probeData[experimentName], geometry, fitWindow)
+    return list(stale)
+
+def recomputeStore(storePath: str, fitWindow: str = young.DEFAULT_WINDOW, profiles: dict = None):
+    # A pass over the stored load and extension columns: raw files aren't needed at all.
+    with store.StoreWriter(storePath) as writer:
+        for probeName, probeData in store.iterStore(storePath):
+            print(f"Recomputing metrics for probe {probeName}...", file = sys.stderr)
+            recomputeProbe(probeName, probeData, fitWindow, profiles, force = True)
+            for experimentName, experimentData in probeData.items():
+                writer.keep(probeName, experimentName, {key: value for key, value in experimentData.items() if key != "data"})
+
+def ingestDirectory(path: str, storePath: str, separator: str, headerLines: int, jobs: int = 1, useCache: bool = True, fitWindow: str = young.DEFAULT_WINDOW,
+        dtype: str = "float64", profiles: dict = None) -> dict:
+    return dict(ingestProbes(path, storePath, separator, headerLines, jobs, useCache, fitWindow, dtype = dtype, profiles = profiles))
+
+def jsonDefault(obj):
+    import numpy as np
+
+    # Sample columns are kept as NumPy arrays: turn them back into lists on the way out.
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, collections.abc.Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def findYoung(elongation: list[float], tension: list[float], window: str = young.DEFAULT_WINDOW) -> dict:
+    # The intercept with the Y axis is taken to be 0. By default we fit the first
+    # half of the samples.
+    return young.fitExperiments([(elongation, tension)], window)[0]
+
+def findYoungBatch(probeData: dict, window: str = young.DEFAULT_WINDOW) -> dict:
+    # Fits every experiment of a probe in a single call.
+    fits = young.fitExperiments([(experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"]) for experimentData in probeData.values()], window)
+    return dict(zip(probeData.keys(), fits))
+
+def joinExcels(path: str, probes, points: int = 0, method: str = "lttb"):
+    # Merges the sheets of every per-probe Excel into a single workbook. Rather than reading
+    # those back, sheets are built straight off the parsed data and streamed to disk in a
+    # single pass. Sheets are named after their experiments.
+    import openpyxl
+
+    start = time.perf_counter()
+    wb = openpyxl.Workbook(write_only = True)
+    with instrument.span("joinExcels", path = str(path)) as span:
+        nSheets, nRows, taken = 0, 0, set()
+        for probeName, probeData in probes:
+            print(f"Merging sheets of probe {probeName}...", file = sys.stderr)
+            for experimentName, experimentData in probeData.items():
+                title = sheetTitle(experimentName, taken)
+                if title != experimentName:
+                    print(f"Sheet for {experimentName} renamed to {title}", file = sys.stderr)
+                nRows += writeExperimentSheet(wb, title, experimentData, points, method)
+                nSheets += 1
+
+        wb.save(path)
+        span.set(sheets = nSheets, rows = nRows)
+
+    elapsed, size = time.perf_counter() - start, pathlib.Path(path).stat().st_size
+    print(f"Merged {nSheets} sheets ({nRows} rows) into {path} in {elapsed:.2f} s: " +
+        f"{nRows / elapsed:.0f} rows/s, {size / elapsed / 2**20:.1f} MiB/s", file = sys.stderr)
+
+# Metrics accumulated on ingestion (see metrics.py) on top of the usual ones, along with
+# the name they're exported under. Data processed before they existed won't have them.
+extraMetrics = {
+    "energyToBreak": "Energy to Break [MJ/m^3]",
+    "yieldTensionMPa": "Yield Tension [MPa]",
+    "yieldElongationN": "Yield Elongation [N]",
+    "elongationAtBreak": "Elongation at Break [N]",
+    "tensionAtBreak": "Tension at Break [MPa]"
+}
 
-def summarisedJSON(summaryJSONName: str, processedData: dict):
+def summariseProbe(probeData: dict) -> list[dict]:
+    # Only scalars are looked at: sample columns are never touched.
+    return [{
+        "name": experimentName,
+        "maxTensionMPa": experimentData["maxTensionMPa"],
+        "maxElongationN": experimentData["maxElongationN"],
+        "ductility": experimentData["ductility"],
+        "finalLength": experimentData["finalLength"]["value"],
+        "youngModuleE": experimentData["youngModule"]["E"],
+        "youngModuleScore": experimentData["youngModule"]["score"],
+        **{metric: experimentData.get(metric) for metric in extraMetrics}
+    } for experimentName, experimentData in probeData.items()]
+
+@instrument.traced
+def summarise(processedData: dict) -> dict:
     summary = {}
 
     for probeName, probeData in processedData.items():
         print(f"Summarising data for probe {probeName}...", file = sys.stderr)
-        summary[probeName] = []
+        summary[probeName] = summariseProbe(probeData)
 
-        for experimentName, experimentData in probeData.items():
-            summary[probeName].append({
-                "name": experimentName,
-                "maxTensionMPa": experimentData["maxTensionMPa"],
-                "maxElongationN": experimentData["maxElongationN"],
-                "ductility": experimentData["ductility"],
-                "finalLength": experimentData["finalLength"]["value"],
-                "youngModuleE": experimentData["youngModule"]["E"],
-                "youngModuleScore": experimentData["youngModule"]["score"]
-            })
+    return summary
 
+@instrument.traced
+def dumpSummaryJSON(summaryJSONName: str, summary: dict):
     pathlib.Path(summaryJSONName).write_text(json.dumps(summary, indent = 4))
 
-def shapiroWilkTest(resultExcelName: str, summarisedData: dict):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Shapiro-Wilk Test Results"
+def summarisedJSON(summaryJSONName: str, processedData: dict):
+    dumpSummaryJSON(summaryJSONName, summarise(processedData))
+
+# Summary fields we run the statistics on, along with the name they're exported under.
+shapiroSamples = {
+    "maxTensionMPa": "Tension [MPa]",
+    "maxElongationN": "Elongation [N]",
+    "youngModuleE": "E"
+}
+
+# Specimens left out of the Shapiro-Wilk test unless told otherwise.
+SHAPIRO_EXCLUDE = ['9', '10']
 
-    ws.cell(row = 1, column = 1, value = "Probe Name")
-    ws.cell(row = 1, column = 2, value = "Sample Type")
-    ws.cell(row = 1, column = 3, value = "Statistic (W)")
-    ws.cell(row = 1, column = 4, value = "p-value")
+@instrument.traced
+def shapiroWilkTest(resultExcelName: str, summarisedData: dict, confidence: float = 0.95, excludeSpecimens: list[str] = SHAPIRO_EXCLUDE):
+    import openpyxl
 
-    currRow = 2
+    # Every group (i.e. a sample type of a probe) is gathered first so that the tests and
+    # statistics can be computed on all of them at once.
+    labels, groups = [], []
     for probeName, probeData in summarisedData.items():
         print(f"Working on data for probe {probeName}...", file = sys.stderr)
 
-        try:
-            probeData = [experiment for experiment in probeData if experiment["name"].split('.')[0].split('-')[1] not in ['9', '10']]
-        except IndexError:
+        if any(catalog.specimenIndex(experiment["name"]) is None for experiment in probeData):
             print("Skipping decimation of non-standard probe", file = sys.stderr)
+        else:
+            probeData = [experiment for experiment in probeData if catalog.specimenIndex(experiment["name"]) not in excludeSpecimens]
 
         # Skip running the test on probes with less than 3 measurements: it's nonsense!
         if len(probeData) < 3:
             continue
 
-        ws.cell(row = currRow, column = 1, value = probeName)
+        for field, sampleType in shapiroSamples.items():
+            labels.append((probeName, sampleType))
+            groups.append([experiment[field] for experiment in probeData])
 
-        shapiroMaxTensions = stats.shapiro(np.array([experiment["maxTensionMPa"] for experiment in probeData]))
-        ws.cell(row = currRow, column = 2, value = "Tension [MPa]")
-        ws.cell(row = currRow, column = 3, value = shapiroMaxTensions.statistic)
-        ws.cell(row = currRow, column = 4, value = shapiroMaxTensions.pvalue)
-        currRow += 1
+    results = groupstats.groupStatistics(groups, confidence)
 
-        shapiroMaxElongations = stats.shapiro(np.array([experiment["maxElongationN"] for experiment in probeData]))
-        ws.cell(row = currRow, column = 2, value = "Elongation [N]")
-        ws.cell(row = currRow, column = 3, value = shapiroMaxElongations.statistic)
-        ws.cell(row = currRow, column = 4, value = shapiroMaxElongations.pvalue)
-        currRow += 1
+    wb = openpyxl.Workbook(write_only = True)
+    ws = wb.create_sheet(title = "Shapiro-Wilk Test Results")
 
-        shapiroYoungs = stats.shapiro(np.array([experiment["youngModuleE"] for experiment in probeData]))
-        ws.cell(row = currRow, column = 2, value = "E")
-        ws.cell(row = currRow, column = 3, value = shapiroYoungs.statistic)
-        ws.cell(row = currRow, column = 4, value = shapiroYoungs.pvalue)
-        currRow += 1
+    ws.append(["Probe Name", "Sample Type"] + groupstats.statHeaders)
+    for row in groupstats.tidyRows(labels, results):
+        ws.append(row)
 
     wb.save(resultExcelName)
 
-def summarisedExcel(summaryExcelName: str, processedData: dict):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Summarised Data"
-
-    ws.cell(row = 1, column = 1, value = "Probe Name")
-    ws.cell(row = 1, column = 2, value = "Experiment Name")
-    ws.cell(row = 1, column = 3, value = "Max. Tension [MPa]")
-    ws.cell(row = 1, column = 4, value = "Max. Elongation [N]")
-    ws.cell(row = 1, column = 5, value = "Ductility [%A]")
-    ws.cell(row = 1, column = 6, value = "Final Length [mm]")
-    ws.cell(row = 1, column = 7, value = "E")
-    ws.cell(row = 1, column = 8, value = "E Fit Score")
-
-    currRow = 2
-    for probeName, probeData in processedData.items():
-        print(f"Summarising data for probe {probeName}...", file = sys.stderr)
-        for experimentName, experimentData in probeData.items():
-            ws.cell(row = currRow, column = 1, value = probeName)
-            ws.cell(row = currRow, column = 2, value = experimentName)
-            ws.cell(row = currRow, column = 3, value = experimentData["maxTensionMPa"])
-            ws.cell(row = currRow, column = 4, value = experimentData["maxElongationN"])
-            ws.cell(row = currRow, column = 5, value = experimentData["ductility"])
-            ws.cell(row = currRow, column = 6, value = experimentData["finalLength"]["value"])
-            ws.cell(row = currRow, column = 7, value = experimentData["youngModule"]["E"])
-            ws.cell(row = currRow, column = 8, value = experimentData["youngModule"]["score"])
-            currRow += 1
+@instrument.traced
+def dumpSummaryExcel(summaryExcelName: str, summary: dict):
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only = True)
+    ws = wb.create_sheet(title = "Summarised Data")
+
+    ws.append(["Probe Name", "Experiment Name", "Max. Tension [MPa]", "Max. Elongation [N]",
+        "Ductility [%A]", "Final Length [mm]", "E", "E Fit Score"] + list(extraMetrics.values()))
+
+    for probeName, probeSummary in summary.items():
+        for experimentSummary in probeSummary:
+            ws.append([probeName, experimentSummary["name"], experimentSummary["maxTensionMPa"], experimentSummary["maxElongationN"],
+                experimentSummary["ductility"], experimentSummary["finalLength"], experimentSummary["youngModuleE"], experimentSummary["youngModuleScore"]] +
+                [experimentSummary.get(metric) for metric in extraMetrics])
 
     wb.save(summaryExcelName)
 
-def shoreShapiro():
+def summarisedExcel(summaryExcelName: str, processedData: dict):
+    dumpSummaryExcel(summaryExcelName, summarise(processedData))
+
+@instrument.traced
+def shoreShapiro(confidence: float = 0.95):
+    import numpy as np, pandas as pd, openpyxl
+
+    shoreHardnessFile = "durezaShoreD.xlsx"
     try:
         # Note we need to manually inspect the Excel file to find the indices!
-        shoreHardnessDf = pd.read_excel("durezaShoreD.xlsx").iloc[2:67, 2:22]
+        shoreHardnessDf = pd.read_excel(shoreHardnessFile).iloc[2:67, 2:22]
     except FileNotFoundError:
         print(f"Couldn't load {shoreHardnessFile}...", file = sys.stderr)
         return
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Shapiro-Wilk Test Results"
+    # Each row is a group of hardness measurements: blank cells are just left out.
+    print(f"Working on data for {len(shoreHardnessDf)} rows...", file = sys.stderr)
+    rows = shoreHardnessDf.to_numpy(dtype = float)
+    results = groupstats.groupStatistics([row[~np.isnan(row)] for row in rows], confidence)
 
-    ws.cell(row = 1, column = 1, value = "Row index")
-    ws.cell(row = 1, column = 2, value = "Statistic (W)")
-    ws.cell(row = 1, column = 3, value = "p-value")
+    wb = openpyxl.Workbook(write_only = True)
+    ws = wb.create_sheet(title = "Shapiro-Wilk Test Results")
 
-    for i in range(len(shoreHardnessDf)):
-        print(f"Working on data for row {i}...", file = sys.stderr)
+    ws.append(["Row index"] + groupstats.statHeaders)
+    for row in groupstats.tidyRows([(i + 1,) for i in range(len(rows))], results):
+        ws.append(row)
 
-        ws.cell(row = i + 2, column = 1, value = i + 1)
+    wb.save("durezaShoreShapiro.xlsx")
 
-        shapiroRow = stats.shapiro(np.array(shoreHardnessDf.iloc[i]))
-        ws.cell(row = i + 2, column = 2, value = shapiroRow.statistic)
-        ws.cell(row = i + 2, column = 3, value = shapiroRow.pvalue)
+class ExperimentFigure:
+    # Every per-experiment plot looks the same but for the curve and title: rather than
+    # building a brand new figure for each of them we just swap those in and out.
+    def __init__(self):
+        plt = pyplot()
 
-    wb.save("durezaShoreShapiro.xlsx")
+        self.fig, self.ax = plt.subplots(layout = "constrained")
+        self.ax.set_xlabel("Elongation [N]")
+        self.ax.set_ylabel("Tension [MPa]")
+        self.line, = self.ax.plot([], [], "g")
+
+    def save(self, path: str, title: str, elongation, tension):
+        self.ax.set_title(title)
+        self.line.set_data(elongation, tension)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.fig.savefig(path, bbox_inches = "tight")
+
+# Lazily built so that each worker process gets its own.
+experimentFigure = None
 
 def genPlot(plotDir: str, expName: str, elongation: list[float], tension: list[float]):
-    plt.figure(layout = "constrained")
-    plt.xlabel("Elongation [N]")
-    plt.ylabel("Tension [MPa]")
-    plt.title(expName)
-    plt.plot(elongation, tension, "g")
-    plt.savefig(f"{plotDir}/{expName}.png", bbox_inches = "tight")
-    plt.close()
+    global experimentFigure
+    with instrument.span("genPlot", "file", experiment = expName, points = len(tension)):
+        if experimentFigure is None:
+            experimentFigure = ExperimentFigure()
+        experimentFigure.save(f"{plotDir}/{expName}.png", expName, elongation, tension)
 
+@instrument.traced
 def genAggregatedPlot(plotDir: str, probeName: str, probeData: dict):
+    plt = pyplot()
+
     plt.figure(figsize = (25, 12.5), layout = "constrained")
     plt.xlabel("Elongation [N]")
     plt.ylabel("Tension [MPa]")
@@ -362,115 +688,507 @@ def genAggregatedPlot(plotDir: str, probeName: str, probeData: dict):
     plt.savefig(f"{plotDir}/agg{probeName}.png", bbox_inches = "tight")
     plt.close()
 
-def genCustomPlot(plotDir: str, parsedFiles: dict):
-    for name in ["Prob2Gris.raw", "Prob10Tenaflex.raw", "Prob7.raw", "Prob1AmarilloCanario.raw"]:
-        print(f"Probe {name}:")
-        for experimentName, experimentData in parsedFiles[name].items():
-            print(f"\t{len(experimentData['data']['elongationN'])}\t{len(experimentData['data']['tensionMPa'])}")
+# Probes drawn on the custom plot unless a selection is given.
+CUSTOM_PROBES = ["Prob2Gris.raw", "Prob10Tenaflex.raw", "Prob7.raw", "Prob1AmarilloCanario.raw"]
 
-    # return
+@instrument.traced
+def genCustomPlot(plotDir: str, probes, points: int = 0, method: str = "lttb"):
+    # Draws every experiment of the given `(probeName, probeData)` pairs on a single plot.
+    import numpy as np
+    plt = pyplot()
 
     plt.figure(figsize = (25, 12.5), layout = "constrained")
     plt.xlabel("Elongation [log(N)]")
     plt.ylabel("Tension [MPa]")
-    plt.title("Prob2Gris, Prob10Tenaflex, Prob7 y Prob1AmarilloCanario")
     plt.xscale("log")
 
-    for name in ["Prob2Gris.raw", "Prob10Tenaflex.raw", "Prob7.raw", "Prob1AmarilloCanario.raw"]:
-        for experimentName, experimentData in parsedFiles[name].items():
-            plt.plot(experimentData["data"]["elongationN"],
-                experimentData["data"]["tensionMPa"], label = name)
+    names = []
+    for name, probeData in probes:
+        print(f"Probe {name}:")
+        names.append(name.split(".")[0])
+        for experimentName, experimentData in probeData.items():
+            print(f"\t{len(experimentData['data']['elongationN'])}\t{len(experimentData['data']['tensionMPa'])}")
+            keep = downsample.downsample(experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"], points, method)
+            plt.plot(np.asarray(experimentData["data"]["elongationN"])[keep],
+                np.asarray(experimentData["data"]["tensionMPa"])[keep], label = name)
 
+    plt.title(", ".join(names[:-1]) + " y " + names[-1] if len(names) > 1 else "".join(names))
     plt.legend()
     plt.savefig(f"{plotDir}/customGraph.png", bbox_inches = "tight")
     plt.close()
 
+def genProbePlots(plotDir: str, probeName: str, probeData: dict, aggregated: bool = True, experiments: list[str] = None):
+    # Generates the aggregated plot and the per-experiment ones (all of them unless told otherwise).
+    print(f"Generating plots for probe {probeName}...", file = sys.stderr)
+    experiments = list(probeData) if experiments is None else experiments
+    with instrument.span("genProbePlots", "probe", probe = probeName, plots = len(experiments) + aggregated):
+        if aggregated:
+            genAggregatedPlot(plotDir, probeName, probeData)
+        for experimentName in experiments:
+            experimentData = probeData[experimentName]
+            genPlot(plotDir, experimentName.split(".")[0], experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"])
+
+PLOT_VERSION = 1
+PLOT_FINGERPRINTS = ".plot_fingerprints.json"
+
+def plotFingerprint(*parts) -> str:
+    import numpy as np
+
+    # Hashes the plotted arrays (without copying them) together with any labels they're drawn with.
+    digest = hashlib.blake2b(str(PLOT_VERSION).encode(), digest_size = 16)
+    for part in parts:
+        if isinstance(part, str):
+            digest.update(part.encode())
+        else:
+            digest.update(memoryview(np.ascontiguousarray(part, dtype = float)).cast("B"))
+    return digest.hexdigest()
+
+# Sinks for the single-pass pipeline: each one is handed every probe exactly once
+# through `consume()` and wraps up whatever it needs to on `close()`.
+class SummarySink:
+    # Summary rows are tiny, so we can hold on to them for the whole run.
+    def __init__(self, jsonName: str = None, excelName: str = None, shapiroName: str = None, confidence: float = 0.95, excludeSpecimens: list[str] = SHAPIRO_EXCLUDE):
+        self.jsonName, self.excelName, self.shapiroName = jsonName, excelName, shapiroName
+        self.confidence, self.excludeSpecimens = confidence, excludeSpecimens
+        self.summary = {}
+
+    def consume(self, probeName: str, probeData: dict):
+        print(f"Summarising data for probe {probeName}...", file = sys.stderr)
+        self.summary[probeName] = summariseProbe(probeData)
+
+    def close(self):
+        if self.jsonName:
+            dumpSummaryJSON(self.jsonName, self.summary)
+        if self.excelName:
+            dumpSummaryExcel(self.excelName, self.summary)
+        if self.shapiroName:
+            shapiroWilkTest(self.shapiroName, self.summary, self.confidence, self.excludeSpecimens)
+
+class ProbeExcelSink:
+    def __init__(self, excelDir: str, points: int = 0, method: str = "lttb"):
+        self.excelDir = excelDir
+        self.points, self.method = points, method
+
+    def consume(self, probeName: str, probeData: dict):
+        print(f"Dumping Excel for probe {probeName}", file = sys.stderr)
+        dumpExcel(f"./{self.excelDir}/{probeName}.xlsx", probeData, self.points, self.method)
+
+    def close(self):
+        pass
+
+class PlotSink:
+    # Plots whose data hasn't changed since they were last drawn are skipped. The rest are
+    # rendered one probe per task on a pool of workers if we're given more than one job.
+    def __init__(self, plotDir: str, jobs: int = 1, points: int = 0, method: str = "lttb", pool: concurrent.futures.Executor = None):
+        self.plotDir = plotDir
+        self.points, self.method = points, method
+        self.fingerprintsPath = pathlib.Path(plotDir) / PLOT_FINGERPRINTS
+        try:
+            self.fingerprints = json.loads(self.fingerprintsPath.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.fingerprints = {}
+
+        # A pool we're handed over belongs to the caller: we don't shut it down.
+        jobs = resolveJobs(jobs)
+        self.ownPool = pool is None and jobs > 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers = jobs) if self.ownPool else pool
+        self.inFlight = 2 * jobs
+        self.pending = collections.deque()
+
+        self.nRendered, self.nSkipped = 0, 0
+
+    def isFresh(self, plotName: str, fingerprint: str) -> bool:
+        return self.fingerprints.get(plotName) == fingerprint and (pathlib.Path(self.plotDir) / plotName).exists()
+
+    def consume(self, probeName: str, probeData: dict):
+        import numpy as np
+
+        curves, fingerprints, stale = {}, {}, []
+        for experimentName, experimentData in probeData.items():
+            expName = experimentName.split(".")[0]
+
+            # Curves are decimated before fingerprinting them so that changing the number
+            # of points to draw is noticed too.
+            elongation, tension = np.asarray(experimentData["data"]["elongationN"]), np.asarray(experimentData["data"]["tensionMPa"])
+            keep = downsample.downsample(elongation, tension, self.points, self.method)
+            curves[experimentName] = {"data": {"elongationN": elongation[keep], "tensionMPa": tension[keep]}}
+            fingerprints[f"{expName}.png"] = plotFingerprint(expName, curves[experimentName]["data"]["elongationN"], curves[experimentName]["data"]["tensionMPa"])
+            if not self.isFresh(f"{expName}.png", fingerprints[f"{expName}.png"]):
+                stale.append(experimentName)
+
+        aggName = f"agg{probeName}.png"
+        fingerprints[aggName] = plotFingerprint(probeName, *fingerprints.values())
+        aggregated = not self.isFresh(aggName, fingerprints[aggName])
+
+        nPlots = len(stale) + aggregated
+        self.nSkipped += len(fingerprints) - nPlots
+        if not nPlots:
+            return
+        self.nRendered += nPlots
+
+        # Only ship over to the workers what they'll actually draw.
+        if not aggregated:
+            curves = {experimentName: curves[experimentName] for experimentName in stale}
+
+        if self.pool is None:
+            genProbePlots(self.plotDir, probeName, curves, aggregated, stale)
+            self.fingerprints.update(fingerprints)
+            return
+
+        self.pending.append((instrument.submit(self.pool, genProbePlots, self.plotDir, probeName, curves, aggregated, stale), fingerprints))
+        while len(self.pending) > self.inFlight:
+            self.collect()
+
+    def evict(self, plotNames: list[str]):
+        # Drops plots whose data is gone, along with their fingerprints.
+        for plotName in plotNames:
+            self.fingerprints.pop(plotName, None)
+            (pathlib.Path(self.plotDir) / plotName).unlink(missing_ok = True)
+
+    def collect(self):
+        future, fingerprints = self.pending.popleft()
+        instrument.result(future)
+        self.fingerprints.update(fingerprints)
+
+    def close(self):
+        try:
+            while self.pending:
+                self.collect()
+        finally:
+            if self.ownPool:
+                self.pool.shutdown()
+            self.fingerprintsPath.write_text(json.dumps(self.fingerprints, indent = 2))
+
+        print(f"Plots: {self.nRendered} rendered, {self.nSkipped} up to date", file = sys.stderr)
+        instrument.mark("plotCache", rendered = self.nRendered, skipped = self.nSkipped)
+
+class ProbeFilter:
+    # Only hands the given probes over to the wrapped sink.
+    def __init__(self, sink, probes: set[str]):
+        self.sink, self.probes = sink, probes
+
+    def consume(self, probeName: str, probeData: dict):
+        if probeName in self.probes:
+            self.sink.consume(probeName, probeData)
+
+    def close(self):
+        self.sink.close()
+
+def pipelineSinks(args, pool: concurrent.futures.Executor = None) -> list:
+    # Running the pipeline without asking for any output in particular means we want them all.
+    wantsAll = not any([args.summarised_json, args.summarised_excel, args.shapiro, args.excel, args.plots])
+
+    sinks = []
+    if wantsAll or args.summarised_json or args.summarised_excel or args.shapiro:
+        sinks.append(SummarySink(
+            args.output_json_summary if wantsAll or args.summarised_json else None,
+            args.output_excel_summary if wantsAll or args.summarised_excel else None,
+            args.shapiro_output if wantsAll or args.shapiro else None,
+            args.confidence, shapiroExclude(args)
+        ))
+    if wantsAll or args.excel:
+        sinks.append(ProbeExcelSink(args.excel_dir, args.excel_points, args.excel_downsample))
+    if wantsAll or args.plots:
+        sinks.append(PlotSink(args.plot_dir, args.jobs, args.plot_points, args.plot_downsample, pool))
+
+    return sinks
+
+def runPipeline(probes, sinks: list):
+    # Only the probe at hand is kept alive: once every sink is done with it its
+    # sample columns can be freed before moving on to the next one.
+    for probeName, probeData in probes:
+        for sink in sinks:
+            with instrument.span(f"{type(sink).__name__}.consume", "probe", probe = probeName, experiments = len(probeData)):
+                sink.consume(probeName, probeData)
+        del probeData
+
+    for sink in sinks:
+        with instrument.span(f"{type(sink).__name__}.close"):
+            sink.close()
+
+def selection(args, probes: list[str] = None) -> catalog.Selection:
+    return catalog.Selection(args.probe or probes, args.experiment, args.exclude_specimen, args.where)
+
+def shapiroExclude(args) -> list[str]:
+    return SHAPIRO_EXCLUDE if args.exclude_specimen is None else args.exclude_specimen
+
+def selectProbes(probes, selected: catalog.Selection):
+    # Filters `(probeName, probeData)` pairs that don't come off a store (and so have no
+    # catalog on disk) through a throwaway catalog built for each probe.
+    for probeName, probeData in probes:
+        keys = catalog.selectKeys(catalog.inMemory({probeName: probeData}), selected)
+        probeData = {experimentName: experimentData for experimentName, experimentData in probeData.items() if (probeName, experimentName) in keys}
+        if probeData:
+            yield probeName, probeData
+
+def iterParsedFiles(args, selected: catalog.Selection = None):
+    # Probes are handed over one at a time. The binary store is preferred unless we're
+    # explicitly told to read a JSON file. If there's a selection, stored experiments are
+    # picked off the catalog so that the rest of them are never even opened.
+    if selected is None:
+        selected = selection(args)
+
+    if args.input is None and store.storeExists(args.store):
+        return store.iterStore(args.store, catalog.selectKeys(store.openCatalog(args.store), selected) if selected else None)
+
+    # Lists of floats are turned into compact experiments (see experiment.py) on the way
+    # in, each one replaces its lists as soon as it's built so that they can be freed.
+    parsedFiles = json.loads(pathlib.Path(args.input or "processed_data.json").read_text())
+    for probeData in parsedFiles.values():
+        for experimentName, experimentData in probeData.items():
+            probeData[experimentName] = experiment.fromDict(experimentData, args.dtype)
+    return selectProbes(parsedFiles.items(), selected) if selected else iter(parsedFiles.items())
+
+def loadParsedFiles(args, selected: catalog.Selection = None) -> dict:
+    return dict(iterParsedFiles(args, selected))
+
+def queryCatalog(args):
+    # Prints the selected experiments as tab-separated values.
+    if args.input is None and store.storeExists(args.store):
+        conn = store.openCatalog(args.store)
+    else:
+        conn = catalog.inMemory(json.loads(pathlib.Path(args.input or "processed_data.json").read_text()))
+
+    rows = catalog.query(conn, selection(args))
+    print("\t".join(catalog.columns))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+
+def watchDirectory(args):
+    # Keeps the store and outputs up to date as raw files show up on (or go away from)
+    # `args.path`. Every time something changes the directory is ingested again: only
+    # new or modified files are parsed, everything else is a cache hit. The summaries are
+    # regenerated as a whole off the scalars, whilst per-probe Excels and plots are only
+    # redone for the probes that changed.
+    jobs = resolveJobs(args.jobs)
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers = jobs, initializer = quietWorker) if jobs > 1 else None
+
+    # Files we couldn't parse (say, a test that was aborted) are left out until they change.
+    failed = set()
+
+    def onChange(settled: list[pathlib.Path], removed: list[pathlib.Path]):
+        start = time.perf_counter()
+        failed.difference_update(settled)
+        affected = {experimentKey(file)[0] for file in settled + removed}
+
+        while True:
+            files = [file for file in watcher.files() if file not in failed]
+            try:
+                with instrument.span("watchCycle", settled = len(settled), removed = len(removed)):
+                    probes = ingestProbes(args.path, args.store, args.separator, args.header_lines, jobs, True, args.fit_window, files, pool, args.dtype, args.geometry,
+                        set(watcher.changing()))
+                    if selection(args):
+                        probes = selectProbes(probes, selection(args))
+                    sinks = pipelineSinks(args, pool)
+                    for sink in sinks:
+                        if isinstance(sink, PlotSink):
+                            sink.evict(removedPlots(removed, files))
+                    runPipeline(probes, [sink if isinstance(sink, SummarySink) else ProbeFilter(sink, affected) for sink in sinks])
+                break
+            except Exception as e:
+                # Find out which of the new files are to blame and try again without them.
+                culprits = {file for file in settled if file not in failed and not parsesCleanly(file, args.separator, args.header_lines)}
+                if not culprits:
+                    raise
+                for file in culprits:
+                    print(f"Couldn't parse {file.name} ({e}): skipping it until it changes", file = sys.stderr)
+                failed.update(culprits)
+
+        print(f"Processed {len(settled)} new or modified and {len(removed)} removed files in {time.perf_counter() - start:.2f} s", file = sys.stderr)
+
+    # Being stopped by a service manager is just as good as a Ctrl+C.
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    watcher = watch.Watcher(args.path, isRawFile, args.watch_settle)
+    print(f"Watching {args.path} for raw files...", file = sys.stderr)
+    try:
+        watcher.run(onChange, args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def quietWorker():
+    # Workers leave stopping to the main process, which shuts the pool down: they'd
+    # otherwise inherit its SIGTERM handler and get Ctrl+C'd along with it.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def removedPlots(removed: list[pathlib.Path], remaining: list[pathlib.Path]) -> list[str]:
+    # Plots of the removed experiments, plus the aggregated ones of probes left with none.
+    probesGone = {experimentKey(file)[0] for file in removed} - {experimentKey(file)[0] for file in remaining}
+    return [f"{file.name.split('.')[0]}.png" for file in removed] + [f"agg{probeName}.png" for probeName in sorted(probesGone)]
+
+def parsesCleanly(file: pathlib.Path, separator: str, headerLines: int) -> bool:
+    try:
+        parseRawData(file, separator, headerLines)
+    except Exception:
+        return False
+    return True
+
 def main():
     args = parseArgs()
 
+    if not (args.trace or args.profile or args.profile_memory):
+        return run(args)
+
+    instrument.tracer.configure(args.profile, args.profile_memory, args.profile_dir)
+    try:
+        with instrument.span("run"):
+            return run(args)
+    finally:
+        if args.trace:
+            instrument.dump(args.trace, args.trace_format)
+
+def run(args):
+    try:
+        catalog.validate(selection(args))
+    except sqlite3.Error as e:
+        print(f"Invalid selection: {e}", file = sys.stderr)
+        return -1
+
+    if args.watch:
+        if not pathlib.Path(args.path).is_dir():
+            print(f"{args.path} is not a directory: there's nothing to watch", file = sys.stderr)
+            return -1
+        watchDirectory(args)
+        return 0
+
+    if args.recompute:
+        if not store.storeExists(args.store):
+            print(f"Couldn't load {args.store}. Have you processed the data?", file = sys.stderr)
+            return -1
+        with instrument.span("recomputeStore"):
+            recomputeStore(args.store, args.fit_window, args.geometry)
+
+    if args.pipeline:
+        # Parsing and plotting share a single pool of workers.
+        jobs = resolveJobs(args.jobs)
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers = jobs) if jobs > 1 else None
+        try:
+            if pathlib.Path(args.path).is_dir():
+                print(f"Ingesting raw data into {args.store}...", file = sys.stderr)
+                probes = ingestProbes(args.path, args.store, args.separator, args.header_lines, jobs, not args.no_cache, args.fit_window, pool = pool, dtype = args.dtype,
+                    profiles = args.geometry)
+                # The whole directory is still ingested: we just don't hand unselected experiments over.
+                if selection(args):
+                    probes = selectProbes(probes, selection(args))
+            else:
+                try:
+                    probes = iterParsedFiles(args)
+                except FileNotFoundError:
+                    print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
+                    return -1
+
+            runPipeline(probes, pipelineSinks(args, pool))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return 0
+
+    if args.query:
+        try:
+            queryCatalog(args)
+        except FileNotFoundError:
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
+            return -1
+        except sqlite3.Error as e:
+            print(f"Couldn't query the catalog: {e}", file = sys.stderr)
+            return -1
+        return 0
+
     if args.summarised_excel:
         try:
-            parsedFiles = json.loads(pathlib.Path(args.input).read_text())
+            parsedFiles = loadParsedFiles(args)
         except FileNotFoundError:
-            print(f"Couldn't load {args.input}. Have you processed the data?", file = sys.stderr)
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
             return -1
         summarisedExcel(args.output_excel_summary, parsedFiles)
 
     if args.summarised_json:
         try:
-            parsedFiles = json.loads(pathlib.Path(args.input).read_text())
+            parsedFiles = loadParsedFiles(args)
         except FileNotFoundError:
-            print(f"Couldn't load {args.input}. Have you processed the data?", file = sys.stderr)
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
             return -1
         summarisedJSON(args.output_json_summary, parsedFiles)
 
     if args.shapiro:
-        try:
-            summarisedData = json.loads(pathlib.Path(args.summary).read_text())
-        except FileNotFoundError:
-            print(f"Couldn't load {args.summary}. Have you summarised the data? You can use:\n" +
-                  "\tpython3 process_data.py --summarised-json foo", file = sys.stderr)
-            return -1
-        shapiroWilkTest(args.shapiro_output, summarisedData)
+        # The summary can't tell experiments apart but by their name: selections are run
+        # against the catalog instead, which only ever looks at scalars.
+        if selection(args):
+            try:
+                summarisedData = {probeName: summariseProbe(probeData) for probeName, probeData in iterParsedFiles(args)}
+            except FileNotFoundError:
+                print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
+                return -1
+        else:
+            try:
+                summarisedData = json.loads(pathlib.Path(args.summary).read_text())
+            except FileNotFoundError:
+                print(f"Couldn't load {args.summary}. Have you summarised the data? You can use:\n" +
+                      "\tpython3 process_data.py --summarised-json foo", file = sys.stderr)
+                return -1
+        shapiroWilkTest(args.shapiro_output, summarisedData, args.confidence, shapiroExclude(args))
 
     if args.shore:
-        shoreShapiro()
+        shoreShapiro(args.confidence)
 
     if args.merge_excels:
-        joinExcels(args.excel_dir)
+        try:
+            joinExcels(args.merged_excel, iterParsedFiles(args), args.excel_points, args.excel_downsample)
+        except FileNotFoundError:
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
+            return -1
         return 0
 
     if args.excel:
         try:
-            parsedFiles = json.loads(pathlib.Path(args.input).read_text())
+            parsedFiles = loadParsedFiles(args)
         except FileNotFoundError:
-            print(f"Couldn't load {args.input}. Have you processed the data?", file = sys.stderr)
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
             return -1
 
         for probe, data in parsedFiles.items():
             print(f"Dumping Excel for probe {probe}", file = sys.stderr)
-            dumpExcel(f"./{args.excel_dir}/{probe}.xlsx", data)
+            dumpExcel(f"./{args.excel_dir}/{probe}.xlsx", data, args.excel_points, args.excel_downsample)
         return 0
 
     if args.plots:
         try:
-            parsedFiles = json.loads(pathlib.Path(args.input).read_text())
+            parsedFiles = loadParsedFiles(args)
         except FileNotFoundError:
-            print(f"Couldn't load {args.input}. Have you processed the data?", file = sys.stderr)
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
             return -1
 
-        for probeName, probeData in parsedFiles.items():
-            print(f"Generating plots for probe {probeName}...", file = sys.stderr)
-            genAggregatedPlot(args.plot_dir, probeName, probeData)
-            for experimentName, experimentData in probeData.items():
-                genPlot(args.plot_dir, experimentName.split(".")[0], experimentData["data"]["elongationN"], experimentData["data"]["tensionMPa"])
+        runPipeline(parsedFiles.items(), [PlotSink(args.plot_dir, args.jobs, args.plot_points, args.plot_downsample)])
         return 0
 
     if args.plots_custom:
         try:
-            parsedFiles = json.loads(pathlib.Path(args.input).read_text())
+            parsedFiles = loadParsedFiles(args, selection(args, CUSTOM_PROBES))
         except FileNotFoundError:
-            print(f"Couldn't load {args.input}. Have you processed the data?", file = sys.stderr)
+            print(f"Couldn't load {args.input or args.store}. Have you processed the data?", file = sys.stderr)
             return -1
 
-        # print(json.dumps(list(parsedFiles.keys()), indent = 2))
+        if not parsedFiles:
+            print("Nothing selected to plot: check the custom probes and your selection.", file = sys.stderr)
+            return -1
 
-        genCustomPlot(args.plot_dir, parsedFiles)
+        genCustomPlot(args.plot_dir, parsedFiles.items(), args.plot_points, args.plot_downsample)
 
     if pathlib.Path(args.path).is_dir():
-        parsedFiles = {}
-        for file in pathlib.Path(args.path).iterdir():
-            if file.name.split('.')[1] != "raw":
-                continue
-
-            fileRoot = file.name.split('-')[0]
-            if not parsedFiles.get(fileRoot, False):
-                parsedFiles[fileRoot] = {}
-
-            parsedFiles[fileRoot][file.name] = parseRawData(file, args.separator, args.header_lines)
-
-        print("Dumping parsed data to a JSON file...", file = sys.stderr)
-        pathlib.Path(args.output).write_text(json.dumps(parsedFiles, indent = 2))
+        print(f"Ingesting raw data into {args.store}...", file = sys.stderr)
+        with instrument.span("ingestDirectory"):
+            parsedFiles = ingestDirectory(args.path, args.store, args.separator, args.header_lines, args.jobs, not args.no_cache, args.fit_window, args.dtype, args.geometry)
+
+        if args.export_json:
+            print("Dumping parsed data to a JSON file...", file = sys.stderr)
+            with instrument.span("exportJSON", path = args.output):
+                pathlib.Path(args.output).write_text(json.dumps(parsedFiles, indent = 2, default = jsonDefault))
 
         return 0
 
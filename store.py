@@ -0,0 +1,174 @@
+import json, pathlib, shutil
+
+import catalog, experiment
+
+# Binary columnar store for parsed experiments. Each sample column lives on its own
+# `.npy` file so that consumers can memory-map just the columns they touch, whilst
+# every scalar (header fields, maxima, Young's modulus...) is kept on a small JSON
+# file that can be read without opening a single sample array:
+#
+#   processed_data.store/
+#   |-- metadata.json
+#   |-- catalog.sqlite
+#   `-- <probe>/<experiment>/<column>.npy
+#
+# The metadata also records a fingerprint of the raw file each experiment was parsed
+# from so that the store doubles as a cache for incremental re-processing. The catalog
+# indexes those scalars so that experiments can be selected without reading any columns.
+#
+# Only the columns the machine writes are stored, with the precision they were parsed
+# with: derived ones (tension and elongation) are computed off them when read with the
+# geometry recorded on the metadata. Stores written before that hold derived columns
+# too, which are ignored in favour of load and extension so that the geometry applies.
+#
+# NumPy is only imported when sample columns are actually read or written: modes that
+# just need the metadata don't have to pay for it.
+
+STORE_VERSION = 1
+METADATA_FILE = "metadata.json"
+
+class LazyColumns(experiment.Columns):
+    # Behaves like the columns of a freshly parsed experiment, but they're only
+    # memory-mapped (i.e. zero-copy) the first time they're accessed.
+    def __init__(self, path: pathlib.Path, columns: list[str], geometry: dict = None):
+        super().__init__({}, geometry)
+        self.path = path
+        self.columns = columns
+
+    def stored(self) -> list[str]:
+        return self.columns
+
+    def load(self, column: str):
+        import numpy as np
+
+        if column not in self.raw:
+            self.raw[column] = np.load(self.path / f"{column}.npy", mmap_mode = "r")
+        return self.raw[column]
+
+def storeExists(path: str) -> bool:
+    return (pathlib.Path(path) / METADATA_FILE).is_file()
+
+def readMetadata(path: str) -> dict:
+    metadata = json.loads((pathlib.Path(path) / METADATA_FILE).read_text())
+    if metadata.get("version") != STORE_VERSION:
+        raise ValueError(f"unsupported store version {metadata.get('version')} on {path}")
+    return metadata
+
+class StoreWriter:
+    # Updates a store in place: experiments are either re-written with `add()` or
+    # carried over untouched with `keep()`. Whatever isn't mentioned is evicted
+    # from the store on `close()`.
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+
+        if storeExists(self.path):
+            previous = readMetadata(self.path)
+            self.previous = previous["probes"]
+            self.previousSources = previous.get("sources", {})
+        elif self.path.exists() and any(self.path.iterdir()):
+            raise FileExistsError(f"{self.path} exists and is not an experiment store")
+        else:
+            self.previous, self.previousSources = {}, {}
+
+        self.path.mkdir(parents = True, exist_ok = True)
+
+        self.metadata, self.sources = {}, {}
+        self.nEvicted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        # Don't update the metadata if something went wrong: it must keep on
+        # describing whatever was there before.
+        if excType is None:
+            self.close()
+
+    def add(self, probeName: str, experimentName: str, experimentData: dict, source: dict = None):
+        import numpy as np
+
+        expDir = self.path / probeName / experimentName
+
+        # Columns are written to a scratch directory which is then swapped in place so
+        # that an interrupted run never leaves a half-written experiment behind.
+        scratch = expDir.with_name(expDir.name + ".tmp")
+        if scratch.exists():
+            shutil.rmtree(scratch)
+        scratch.mkdir(parents = True)
+
+        data = experimentData["data"]
+        columns = data.stored() if isinstance(data, experiment.Columns) else list(data)
+        for column in columns:
+            samples = np.asarray(data[column])
+            np.save(scratch / f"{column}.npy", samples if samples.dtype.kind == "f" else samples.astype(float))
+
+        if expDir.exists():
+            shutil.rmtree(expDir)
+        scratch.rename(expDir)
+
+        scalars = {key: value for key, value in experimentData.items() if key != "data"}
+        scalars["columns"] = columns
+        self.metadata.setdefault(probeName, {})[experimentName] = scalars
+
+        if source is not None:
+            self.sources.setdefault(probeName, {})[experimentName] = source
+
+    def keep(self, probeName: str, experimentName: str, scalars: dict = None, source: dict = None):
+        # Stored columns are carried over as they are, but scalars (and the source's
+        # fingerprint) can be updated if need be.
+        if scalars is None:
+            scalars = self.previous[probeName][experimentName]
+        else:
+            scalars = {**scalars, "columns": self.previous[probeName][experimentName]["columns"]}
+        self.metadata.setdefault(probeName, {})[experimentName] = scalars
+
+        if source is None:
+            source = self.previousSources.get(probeName, {}).get(experimentName)
+        if source is not None:
+            self.sources.setdefault(probeName, {})[experimentName] = source
+
+    def close(self):
+        # The metadata is swapped in atomically: readers see either the old or the new one.
+        scratch = self.path / (METADATA_FILE + ".tmp")
+        scratch.write_text(json.dumps({"version": STORE_VERSION, "probes": self.metadata, "sources": self.sources}, default = float))
+        scratch.replace(self.path / METADATA_FILE)
+        catalog.build(self.path, self.metadata)
+
+        for probeName, probeData in self.previous.items():
+            for experimentName in probeData:
+                if experimentName not in self.metadata.get(probeName, {}):
+                    shutil.rmtree(self.path / probeName / experimentName, ignore_errors = True)
+                    self.nEvicted += 1
+
+            if probeName not in self.metadata:
+                shutil.rmtree(self.path / probeName, ignore_errors = True)
+
+def loadSources(path: str) -> dict:
+    # Describes which raw file (and how) each experiment was parsed from.
+    return readMetadata(path).get("sources", {})
+
+def openCatalog(path: str):
+    # Stores written before the catalog came along get theirs built on the fly.
+    if not (pathlib.Path(path) / catalog.CATALOG_FILE).is_file():
+        catalog.build(path, readMetadata(path)["probes"])
+    return catalog.connect(path)
+
+def iterStore(path: str, only: set[tuple[str, str]] = None):
+    # Yields `(probeName, probeData)` one probe at a time. Nothing keeps a reference to
+    # the probes handed out, so their columns are unmapped as soon as the caller is done.
+    # If given, only the `(probeName, experimentName)` pairs on `only` are handed out.
+    path = pathlib.Path(path)
+    metadata = readMetadata(path)
+
+    for probeName, probeData in metadata["probes"].items():
+        experiments = {}
+        for experimentName, scalars in probeData.items():
+            if only is not None and (probeName, experimentName) not in only:
+                continue
+            columns = scalars.pop("columns")
+            experiments[experimentName] = {"data": LazyColumns(path / probeName / experimentName, columns, scalars.get("dimensions")), **scalars}
+        if experiments:
+            yield probeName, experiments
+
+def loadStore(path: str, only: set[tuple[str, str]] = None) -> dict:
+    return dict(iterStore(path, only))
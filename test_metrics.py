@@ -0,0 +1,66 @@
+import numpy as np
+
+import metrics, young
+
+def test_brittle_curve_has_no_yield_point():
+    # Linear up to 100 MPa, then the load falls away as the specimen breaks.
+    elongation = np.r_[np.linspace(0, 0.1, 1000), [0.1001, 0.1002, 0.1003, 0.1004]]
+    tension = np.r_[np.linspace(0, 100, 1000), [60, 20, 0.5, 0.6]]
+
+    result = metrics.accumulate(elongation, tension)
+    assert result["maxTensionMPa"] == 100
+    assert result["yieldTensionMPa"] is None and result["yieldElongationN"] is None
+
+    # It breaks right before the load falls below half the peak: the tail recorded
+    # afterwards doesn't count.
+    assert result["tensionAtBreak"] == 60 and result["elongationAtBreak"] == 0.1001
+    assert abs(result["energyToBreak"] - (0.1 * 100 / 2 + 0.0001 * (100 + 60) / 2)) < 1e-9
+
+def test_break_point_across_blocks(monkeypatch):
+    elongation = np.r_[np.linspace(0, 0.1, 1000), [0.1001, 0.1002, 0.1003, 0.1004]]
+    tension = np.r_[np.linspace(0, 100, 1000), [60, 20, 0.5, 0.6]]
+    expected = metrics.accumulate(elongation, tension)
+
+    for chunkRows in [3, 999, 1000, 1001]:
+        monkeypatch.setattr(metrics, "CHUNK_ROWS", chunkRows)
+        result = metrics.accumulate(elongation, tension)
+        assert result["tensionAtBreak"] == expected["tensionAtBreak"]
+        assert abs(result["energyToBreak"] - expected["energyToBreak"]) < 1e-9
+
+def test_noise_doesnt_trigger_yield_point():
+    # A 60 MPa yield point with machine noise on top: dips right after 1 MPa used to be
+    # taken for the yield point.
+    rng = np.random.default_rng(0)
+    elongation = np.linspace(0, 0.3, 30000)
+    clean = np.where(elongation < 0.03, 2000 * elongation, 57 + 20 * (elongation - 0.03))
+    result = metrics.accumulate(elongation, clean + rng.normal(0, 0.03, len(elongation)))
+    assert abs(result["yieldTensionMPa"] - 60) < 0.2 and abs(result["yieldElongationN"] - 0.03) < 1e-3
+
+    # Hardening all the way through: no yield point at all, however noisy.
+    hardening = np.where(elongation < 0.03, 2000 * elongation, 60 + 100 * (elongation - 0.03))
+    assert metrics.accumulate(elongation, hardening + rng.normal(0, 0.03, len(elongation)))["yieldTensionMPa"] is None
+
+def test_yield_drop_is_found_across_blocks(monkeypatch):
+    # Linear up to 50 MPa, drops to 45 MPa and hardens from there on.
+    elongation = np.linspace(0, 0.3, 3000)
+    tension = np.where(elongation < 0.05, 1000 * elongation, 45 + 10 * (elongation - 0.05))
+
+    expected = metrics.accumulate(elongation, tension)
+    assert expected["yieldTensionMPa"] == tension[elongation < 0.05].max()
+
+    for chunkRows in [500, 501]:
+        monkeypatch.setattr(metrics, "CHUNK_ROWS", chunkRows)
+        assert metrics.accumulate(elongation, tension)["yieldTensionMPa"] == expected["yieldTensionMPa"]
+
+def test_young_score_matches_batch_fit_on_large_means(monkeypatch):
+    # A large mean with a small spread loses the score to cancellation on expanded sums.
+    rng = np.random.default_rng(0)
+    elongation = np.linspace(1000, 1001, 200000)
+    tension = 2000 * elongation + rng.normal(0, 2, len(elongation))
+    expected = young.fitBatch([elongation], [tension])[0]
+
+    for chunkRows in [metrics.CHUNK_ROWS, 777]:
+        monkeypatch.setattr(metrics, "CHUNK_ROWS", chunkRows)
+        fit = metrics.accumulate(elongation, tension, "fraction:1")["youngModule"]
+        assert abs(fit["E"] - expected["E"]) <= 1e-12 * expected["E"]
+        assert abs(fit["score"] - expected["score"]) <= 1e-12
@@ -0,0 +1,69 @@
+import time, pathlib
+
+# Polls a directory for files the testing machine drops in. Files are written bit by bit
+# over the course of an experiment, so they're only reported once they're settled: their
+# size and modification time must have stayed the same for `settle` seconds. Polling may
+# be crude, but it works on network shares too and doesn't need any extra dependency.
+
+class Watcher:
+    def __init__(self, path: str, accept, settle: float = 2.0):
+        self.path = pathlib.Path(path)
+        self.accept = accept
+        self.settle = settle
+
+        # Settled files and the stat they were reported with, and files which are still
+        # changing along with the stat they had and the moment they were first seen so.
+        self.known, self.pending = {}, {}
+
+    def scan(self) -> tuple[list[pathlib.Path], list[pathlib.Path]]:
+        # Returns the files that just settled (i.e. new or modified ones) and the ones
+        # that are gone since the last scan.
+        now, present, settled = time.monotonic(), set(), []
+
+        for file in self.path.iterdir():
+            if not self.accept(file):
+                continue
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            present.add(file)
+
+            key = (stat.st_size, stat.st_mtime_ns)
+            if self.known.get(file) == key:
+                self.pending.pop(file, None)
+                continue
+
+            seen = self.pending.get(file)
+            if seen is None or seen[0] != key:
+                self.pending[file] = (key, now)
+            elif now - seen[1] >= self.settle:
+                del self.pending[file]
+                self.known[file] = key
+                settled.append(file)
+
+        removed = [file for file in self.known if file not in present]
+        for file in removed:
+            del self.known[file]
+        for file in [file for file in self.pending if file not in present]:
+            del self.pending[file]
+
+        return sorted(settled), sorted(removed)
+
+    def files(self) -> list[pathlib.Path]:
+        # Every file that has settled at some point, including the ones being written
+        # again: until they settle anew their last settled version is the one that counts.
+        return sorted(self.known)
+
+    def changing(self) -> list[pathlib.Path]:
+        # Settled files that are being written again.
+        return sorted(file for file in self.known if file in self.pending)
+
+    def run(self, onChange, interval: float = 1.0):
+        # Calls `onChange(settled, removed)` whenever something settles or goes away. Runs
+        # until interrupted.
+        while True:
+            settled, removed = self.scan()
+            if settled or removed:
+                onChange(settled, removed)
+            time.sleep(interval)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import typing
+
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+# Closed-form fitting of Young's modulus. We're after the slope of a line crossing the
+# origin (i.e. the intercept with the Y axis is taken to be 0) together with the R^2
+# score of the fit, just like scikit-learn's `LinearRegression(fit_intercept = False)`
+# would give us. The slope of such a line is just `sum(x * y) / sum(x * x)`, so there's
+# no need to build a model per experiment: we can fit any number of them in one go.
+# NumPy is imported on first use so that the CLI can validate fit windows on its own.
+
+# Fit windows are given as strings so that they can be stored along with the results:
+#   fraction:F     -> The first F (i.e. F * 100 %) samples of the experiment.
+#   strain:LO:HI   -> Every sample whose elongation lies within [LO, HI].
+DEFAULT_WINDOW = "fraction:0.5"
+
+def parseWindow(spec: str) -> tuple:
+    kind, *bounds = spec.split(":")
+    try:
+        if kind == "fraction" and len(bounds) == 1:
+            return kind, float(bounds[0])
+        if kind == "strain" and len(bounds) == 2:
+            return kind, float(bounds[0]), float(bounds[1])
+    except ValueError:
+        pass
+    raise ValueError(f"invalid fit window {spec}: expected `fraction:F` or `strain:LO:HI`")
+
+def windowSamples(elongation, tension, spec: str) -> tuple[np.ndarray, np.ndarray]:
+    import numpy as np
+
+    elongation, tension = np.asarray(elongation), np.asarray(tension)
+    window = parseWindow(spec)
+
+    if window[0] == "fraction":
+        fitPoints = int(len(elongation) * window[1])
+        return elongation[:fitPoints], tension[:fitPoints]
+
+    inWindow = (elongation >= window[1]) & (elongation <= window[2])
+    return elongation[inWindow], tension[inWindow]
+
+def fitBatch(xs: list[np.ndarray], ys: list[np.ndarray]) -> list[dict]:
+    import numpy as np
+
+    # Fits every `(x, y)` pair at once: samples are laid out back to back on a single
+    # array and per-experiment sums are computed with `np.add.reduceat()`. Experiments
+    # with no samples on their window get NaNs.
+    lengths = np.array([len(x) for x in xs], dtype = int)
+    results = [{"E": float("nan"), "score": float("nan")} for _ in xs]
+
+    nonEmpty = np.flatnonzero(lengths)
+    if not len(nonEmpty):
+        return results
+
+    x = np.concatenate([np.asarray(xs[i], dtype = float) for i in nonEmpty])
+    y = np.concatenate([np.asarray(ys[i], dtype = float) for i in nonEmpty])
+    counts = lengths[nonEmpty]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    sxx = np.add.reduceat(x * x, starts)
+    sxy = np.add.reduceat(x * y, starts)
+    slopes = np.divide(sxy, sxx, out = np.zeros_like(sxy), where = sxx > 0)
+
+    # The score is computed from the residuals themselves rather than from expanded sums
+    # so that we don't lose precision to cancellation.
+    ssRes = np.add.reduceat((y - np.repeat(slopes, counts) * x) ** 2, starts)
+    means = np.add.reduceat(y, starts) / counts
+    ssTot = np.add.reduceat((y - np.repeat(means, counts)) ** 2, starts)
+
+    # Same convention as scikit-learn for constant targets.
+    scores = np.where(ssTot > 0, 1 - ssRes / np.where(ssTot > 0, ssTot, 1), np.where(ssRes == 0, 1.0, 0.0))
+
+    for i, E, score in zip(nonEmpty, slopes, scores):
+        results[i] = {"E": float(E), "score": float(score)}
+
+    return results
+
+def fitExperiments(curves: list[tuple], window: str = DEFAULT_WINDOW) -> list[dict]:
+    # Takes a list of `(elongation, tension)` pairs and fits each of them on the given window.
+    samples = [windowSamples(elongation, tension, window) for elongation, tension in curves]
+    return [{**result, "window": window} for result in fitBatch([x for x, _ in samples], [y for _, y in samples])]